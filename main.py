@@ -10,17 +10,13 @@ import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from src.transcription.transcriber import SermonTranscriber
-from src.correction.transcription_corrector import leer_transcripcion, corregir_con_claude, guardar_transcripcion_corregida, corregir_transcripcion_por_segmentos
+from src.correction.transcription_corrector import leer_transcripcion, corregir_con_claude, guardar_transcripcion_corregida, corregir_transcripcion_por_segmentos, obtener_cliente
 # Importamos el nuevo módulo de corrección línea por línea
 from src.correction.transcription_line_corrector import corregir_transcripcion_completa
 # Importamos el nuevo módulo de extracción de ideas clave
 from src.content_gen.key_ideas_extractor import extraer_y_guardar_ideas_clave
 # Importamos el editor de ideas clave
 from src.content_gen.editor_ideas_clave import convertir_json_a_txt
-from anthropic import Anthropic
-
-# Cargamos las variables de entorno para manejar información sensible de manera segura
-load_dotenv()
 
 def main():
     """
@@ -28,6 +24,10 @@ def main():
     Esta función demuestra el flujo completo del proceso, desde la configuración
     inicial hasta la generación de contenido para redes sociales.
     """
+    # Cargamos las variables de entorno para manejar información sensible de manera segura.
+    # Lo hacemos aquí y no al importar el módulo, para que importar main no lea el .env
+    load_dotenv()
+
     # Configuramos las rutas de los directorios de trabajo
     base_dir = os.path.dirname(os.path.abspath(__file__))
     input_dir = os.path.join(base_dir, 'input_videos')
@@ -49,7 +49,7 @@ def main():
             raise ValueError("No se encontró la clave de API de Anthropic. Por favor, configura ANTHROPIC_API_KEY en el archivo .env")
 
         # Inicializamos el cliente de Anthropic para la corrección
-        cliente_anthropic = Anthropic(api_key=api_key)
+        cliente_anthropic = obtener_cliente(api_key)
 
         # Inicializamos nuestro transcriptor (mantenemos OpenAI para Whisper)
         whisper_api_key = os.getenv('OPENAI_API_KEY')
@@ -91,13 +91,10 @@ def main():
                         # Guardamos también la ruta al archivo JSON para el nuevo método
                         transcript_json = os.path.join(output_dir, f"{video_name_base}_transcription.json")
                         
-                        if os.path.exists(transcript_txt):
-                            transcription_path = transcript_txt
-                            print(f"Usando archivo de transcripción existente: {transcription_path}")
-                        else:
-                            # Intentamos crear la ruta a partir de la información disponible
-                            transcription_path = transcript_txt
-                            print(f"Intentando usar ruta generada: {transcription_path}")
+                        # process_video siempre exporta el texto plano con este nombre; si no
+                        # existiera, lo detecta la comprobación de abajo
+                        transcription_path = transcript_txt
+                        print(f"Usando archivo de transcripción: {transcription_path}")
                     else:
                         transcription_path = transcription_file
                         # No tenemos JSON en este caso
@@ -128,13 +125,17 @@ def main():
                             print(f"Enviando a Claude para corrección línea por línea...")
                             modelo_claude = "claude-3-7-sonnet-20250219"
                             
-                            # Usamos el nuevo método de corrección
+                            # Usamos el nuevo método de corrección. Si tenemos los datos de la
+                            # transcripción en memoria se los pasamos, para no volver a leer el JSON
+                            # que acabamos de escribir
+                            datos_transcripcion = transcription_file if isinstance(transcription_file, dict) else None
                             exito, texto_corregido = corregir_transcripcion_completa(
                                 cliente_anthropic,
                                 transcription_path,
-                                transcript_json if os.path.exists(transcript_json or "") else None,
+                                transcript_json if datos_transcripcion is None and os.path.exists(transcript_json or "") else None,
                                 corrected_file,
-                                modelo_claude
+                                modelo_claude,
+                                datos_json=datos_transcripcion
                             )
                             
                             # Calculamos estadísticas para mantener consistencia
@@ -177,9 +178,10 @@ def main():
                     continue
                 
                 try:
-                    # Preparamos contenido para redes sociales solo si existe el archivo de transcripción
-                    if os.path.exists(transcription_path):
-                        social_content = transcriber.prepare_social_media_content(transcription_path)
+                    # Preparamos contenido para redes sociales a partir de los datos de la transcripción
+                    # que ya tenemos en memoria (texto, segmentos y marcas de tiempo)
+                    if isinstance(transcription_file, dict):
+                        social_content = transcriber.prepare_social_media_content(transcription_file)
                         
                         # Mostramos un resumen de los resultados
                         print("\nResumen de contenido generado:")
@@ -187,7 +189,7 @@ def main():
                         print(f"- Clips para Reels: {len(social_content['reels'])}")
                         print(f"- Clips para TikTok: {len(social_content['tiktok'])}")
                     else:
-                        print("No se puede generar contenido para redes sociales sin un archivo de transcripción válido.")
+                        print("No se puede generar contenido para redes sociales sin los datos de la transcripción.")
                 except Exception as e:
                     print(f"Error generando contenido para redes sociales: {str(e)}")
                 
@@ -7,7 +7,7 @@ a un formato de texto legible y editable, similar a la estructura de un reel.
 
 import os
 import json
-import argparse
+from pathlib import Path
 
 def convertir_json_a_txt(ruta_json, ruta_salida=None):
     """
@@ -22,8 +22,7 @@ def convertir_json_a_txt(ruta_json, ruta_salida=None):
     """
     try:
         # Leer el archivo JSON
-        with open(ruta_json, 'r', encoding='utf-8') as archivo:
-            ideas = json.load(archivo)
+        ideas = json.loads(Path(ruta_json).read_text(encoding='utf-8'))
         
         # Si no se especifica ruta de salida, la generamos
         if not ruta_salida:
@@ -113,10 +112,6 @@ def convertir_txt_a_json(ruta_txt, ruta_salida=None):
         str: Ruta al archivo JSON creado
     """
     try:
-        # Leer el archivo TXT
-        with open(ruta_txt, 'r', encoding='utf-8') as archivo:
-            lineas = archivo.readlines()
-        
         # Si no se especifica ruta de salida, la generamos
         if not ruta_salida:
             base_name = os.path.splitext(os.path.basename(ruta_txt))[0]
@@ -131,48 +126,50 @@ def convertir_txt_a_json(ruta_txt, ruta_salida=None):
         idea_actual = None
         acto_actual = 1
         
-        for linea in lineas:
-            linea = linea.strip()
-            
-            # Ignorar líneas de comentarios y vacías
-            if not linea or linea.startswith("#"):
-                continue
-            
-            # Detectar cambio de acto
-            if linea.startswith("## ACTO"):
-                if "PLANTEAMIENTO" in linea:
-                    acto_actual = 1
-                elif "DESAFÍO" in linea:
-                    acto_actual = 2
-                elif "RESOLUCIÓN" in linea:
-                    acto_actual = 3
-                continue
-            
-            # Detectar nueva idea
-            if linea.startswith("## IDEA"):
-                # Si ya teníamos una idea en proceso, la guardamos
-                if idea_actual is not None:
-                    ideas.append(idea_actual)
+        # Leer el archivo TXT línea a línea, sin cargarlo entero en una lista
+        with open(ruta_txt, 'r', encoding='utf-8') as archivo:
+            for linea in archivo:
+                linea = linea.strip()
                 
-                # Iniciar nueva idea
-                idea_actual = {
-                    "acto": acto_actual,
-                    "orden": int(linea.split(".")[-1]) if "." in linea else 1,
-                    "texto": "",
-                    "referencia_biblica": "",
-                    "contexto": "",
-                    # Estos campos se calculan automáticamente al final
-                    "duracion_aproximada": 0,
-                    "posicion_relativa": 0
-                }
-            
-            # Detectar campos
-            elif linea.startswith("TEXTO: "):
-                idea_actual["texto"] = linea[7:]
-            elif linea.startswith("REFERENCIA BÍBLICA: "):
-                idea_actual["referencia_biblica"] = linea[20:]
-            elif linea.startswith("CONTEXTO: "):
-                idea_actual["contexto"] = linea[10:]
+                # Ignorar líneas de comentarios y vacías
+                if not linea or linea.startswith("#"):
+                    continue
+                
+                # Detectar cambio de acto
+                if linea.startswith("## ACTO"):
+                    if "PLANTEAMIENTO" in linea:
+                        acto_actual = 1
+                    elif "DESAFÍO" in linea:
+                        acto_actual = 2
+                    elif "RESOLUCIÓN" in linea:
+                        acto_actual = 3
+                    continue
+                
+                # Detectar nueva idea
+                if linea.startswith("## IDEA"):
+                    # Si ya teníamos una idea en proceso, la guardamos
+                    if idea_actual is not None:
+                        ideas.append(idea_actual)
+                    
+                    # Iniciar nueva idea
+                    idea_actual = {
+                        "acto": acto_actual,
+                        "orden": int(linea.split(".")[-1]) if "." in linea else 1,
+                        "texto": "",
+                        "referencia_biblica": "",
+                        "contexto": "",
+                        # Estos campos se calculan automáticamente al final
+                        "duracion_aproximada": 0,
+                        "posicion_relativa": 0
+                    }
+                
+                # Detectar campos
+                elif linea.startswith("TEXTO: "):
+                    idea_actual["texto"] = linea[7:]
+                elif linea.startswith("REFERENCIA BÍBLICA: "):
+                    idea_actual["referencia_biblica"] = linea[20:]
+                elif linea.startswith("CONTEXTO: "):
+                    idea_actual["contexto"] = linea[10:]
         
         # No olvidar la última idea
         if idea_actual is not None:
@@ -204,6 +201,8 @@ def convertir_txt_a_json(ruta_txt, ruta_salida=None):
 
 def main():
     """Función principal para uso en línea de comandos."""
+    import argparse
+    
     parser = argparse.ArgumentParser(description='Herramienta para la edición de ideas clave extraídas de sermones')
     
     # Subparsers para comandos diferentes
@@ -8,6 +8,8 @@ de redes sociales, siguiendo una estructura narrativa de tres actos.
 
 import os
 import json
+from collections import Counter
+from pathlib import Path
 from anthropic import Anthropic
 
 def extraer_ideas_clave(cliente_anthropic, ruta_transcripcion, modelo="claude-3-7-sonnet-20250219"):
@@ -24,8 +26,7 @@ def extraer_ideas_clave(cliente_anthropic, ruta_transcripcion, modelo="claude-3-
     """
     try:
         # Leer la transcripción
-        with open(ruta_transcripcion, 'r', encoding='utf-8') as archivo:
-            transcripcion = archivo.read()
+        transcripcion = Path(ruta_transcripcion).read_text(encoding='utf-8')
         
         # Definimos el prompt para Claude
         sistema = """Eres un asistente especializado en análisis de contenido religioso cristiano.
@@ -80,8 +81,9 @@ TRANSCRIPCIÓN DEL SERMÓN:
 {transcripcion}
 """
         
-        # Realizamos la consulta a Claude
-        respuesta = cliente_anthropic.messages.create(
+        # Realizamos la consulta a Claude. El cliente compartido no reintenta por su cuenta
+        # (los correctores llevan su propio bucle), así que aquí recuperamos los reintentos del SDK
+        respuesta = cliente_anthropic.with_options(max_retries=2).messages.create(
             model=modelo,
             max_tokens=2000,
             temperature=0.1,
@@ -131,10 +133,7 @@ TRANSCRIPCIÓN DEL SERMÓN:
             print(f"Advertencia: Se esperaban 7 ideas, pero se obtuvieron {len(ideas)}")
         
         # Verificamos la distribución de actos
-        actos_count = {1: 0, 2: 0, 3: 0}
-        for idea in ideas:
-            acto = idea.get('acto', 0)
-            actos_count[acto] = actos_count.get(acto, 0) + 1
+        actos_count = Counter(idea.get('acto', 0) for idea in ideas)
         
         if actos_count[1] != 2 or actos_count[2] != 2 or actos_count[3] != 3:
             print(f"Advertencia: Distribución incorrecta de actos. Acto 1: {actos_count[1]}, Acto 2: {actos_count[2]}, Acto 3: {actos_count[3]}")
@@ -0,0 +1,105 @@
+"""
+Utilidades compartidas por los correctores de transcripciones.
+
+Este módulo reúne la caché en disco de las correcciones (un archivo por texto
+corregido) y la agrupación de textos consecutivos en una misma petición, que usan
+tanto el corrector por segmentos como el corrector línea por línea.
+"""
+
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+
+# Máximo de tokens de salida por petición de cada familia de modelos (por prefijo del
+# nombre). Las peticiones agrupadas reservan tokens por cada texto del grupo, así que su
+# max_tokens se recorta al límite del modelo elegido con --model
+LIMITES_TOKENS_SALIDA = {
+    "claude-3-7-sonnet": 64000,
+    "claude-sonnet-4": 64000,
+    "claude-haiku-4": 64000,
+    "claude-opus-4": 32000,
+    "claude-3-5-sonnet": 8192,
+    "claude-3-5-haiku": 8192,
+    "claude-3-opus": 4096,
+    "claude-3-haiku": 4096,
+}
+
+# Límite para un modelo que no está en la tabla: el menor de todos, que ninguno rechaza
+LIMITE_TOKENS_SALIDA_DESCONOCIDO = 4096
+
+def limite_tokens_salida(modelo):
+    """Devuelve el máximo de tokens de salida por petición de `modelo` (conservador si no se conoce)."""
+    for prefijo, limite in LIMITES_TOKENS_SALIDA.items():
+        if modelo.startswith(prefijo):
+            return limite
+    return LIMITE_TOKENS_SALIDA_DESCONOCIDO
+
+def ruta_cache(directorio, modelo, version_prompt, texto):
+    """
+    Devuelve la ruta en caché de la corrección de `texto` con un modelo y una versión del prompt.
+
+    La clave incluye el modelo y la versión del prompt, para que cambiar cualquiera de
+    los dos invalide las correcciones guardadas.
+    """
+    clave = hashlib.sha256(f"{modelo}|v{version_prompt}|{texto}".encode('utf-8')).hexdigest()
+    return Path(directorio) / f"{clave}.txt"
+
+def leer_cache(ruta):
+    """Lee el contenido guardado en `ruta`, o devuelve None si no existe."""
+    try:
+        return Path(ruta).read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"No se pudo leer la caché ({ruta}): {e}")
+        return None
+
+def guardar_cache(ruta, contenido):
+    """
+    Guarda `contenido` en la caché, en `ruta`.
+
+    Escribimos en un archivo temporal y lo renombramos, para que una ejecución
+    interrumpida nunca deje en la caché un archivo a medio escribir.
+    """
+    ruta = Path(ruta)
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, ruta_temporal = tempfile.mkstemp(dir=ruta.parent, suffix=".tmp")
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+            archivo.write(contenido)
+        os.replace(ruta_temporal, ruta)
+    except OSError as e:
+        print(f"No se pudo guardar en caché ({ruta}): {e}")
+
+def agrupar_indices(textos, indices, max_caracteres, max_elementos=None):
+    """
+    Agrupa los índices de textos consecutivos sin superar `max_caracteres` por grupo.
+
+    Un texto más largo que `max_caracteres` forma su propio grupo.
+
+    Args:
+        textos (list): Todos los textos (segmentos o unidades)
+        indices (list): Índices de los textos a agrupar, en orden
+        max_caracteres (int): Máximo de caracteres por grupo
+        max_elementos (int): Máximo de textos por grupo (None = sin límite)
+
+    Returns:
+        list: Lista de grupos, cada uno una lista de índices
+    """
+    grupos = []
+    grupo_actual = []
+    longitud_actual = 0
+    for i in indices:
+        if grupo_actual and (
+            longitud_actual + len(textos[i]) > max_caracteres
+            or (max_elementos is not None and len(grupo_actual) >= max_elementos)
+        ):
+            grupos.append(grupo_actual)
+            grupo_actual = []
+            longitud_actual = 0
+        grupo_actual.append(i)
+        longitud_actual += len(textos[i])
+    if grupo_actual:
+        grupos.append(grupo_actual)
+    return grupos
@@ -1,41 +1,61 @@
 import os
-import argparse
 import time
+import random
 import re
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from anthropic import Anthropic
+from anthropic import Anthropic, APIConnectionError, APIStatusError, DefaultHttpxClient, RateLimitError
 
-def configurar_argumentos():
-    """Configura los argumentos de línea de comandos."""
-    parser = argparse.ArgumentParser(description='Corrige transcripciones usando Claude')
-    parser.add_argument('--input', type=str, required=True, help='Ruta al archivo de transcripción bruta')
-    parser.add_argument('--output', type=str, help='Ruta para guardar la transcripción corregida')
-    parser.add_argument('--api_key', type=str, help='Clave API de Anthropic (o usar variable de entorno ANTHROPIC_API_KEY)')
-    parser.add_argument('--model', type=str, default="claude-3-7-sonnet-20250219", help='Modelo Claude a utilizar')
-    return parser.parse_args()
+# Utilidades compartidas con el otro corrector. Al ejecutar este archivo como script,
+# src/correction es el primer elemento de sys.path.
+try:
+    from src.correction.comun import ruta_cache, leer_cache, guardar_cache, agrupar_indices, limite_tokens_salida
+except ImportError:
+    from comun import ruta_cache, leer_cache, guardar_cache, agrupar_indices, limite_tokens_salida
 
-def leer_transcripcion(ruta_archivo):
-    """Lee el contenido del archivo de transcripción."""
-    try:
-        with open(ruta_archivo, 'r', encoding='utf-8') as archivo:
-            return archivo.read()
-    except Exception as e:
-        print(f"Error al leer el archivo: {e}")
-        return None
+# Patrón para extraer el texto corregido entre los delimitadores del segmento
+PATRON_SEGMENTO = re.compile(r'<INICIO_SEGMENTO>(.*?)<FIN_SEGMENTO>', re.DOTALL)
 
-def corregir_con_claude(cliente, transcripcion, modelo, id_segmento=None, total_segmentos=None):
-    """Envía la transcripción a Claude para corrección."""
-    # Información de segmento para incluir en el prompt
-    info_segmento = ""
-    if id_segmento is not None and total_segmentos is not None:
-        info_segmento = f"\nEste es el segmento {id_segmento} de {total_segmentos} de la transcripción completa."
-    
-    sistema = """Eres un corrector de transcripciones EXTREMADAMENTE CONSERVADOR. Tu ÚNICO trabajo es corregir errores ortográficos, gramaticales y de puntuación OBVIOS. NUNCA, bajo ninguna circunstancia, debes modificar el contenido, longitud, estructura o estilo del texto original. Debes devolver un texto casi idéntico al original, con la misma cantidad aproximada de caracteres."""
-    
-    prompt = f"""
+# Patrón para separar los segmentos de una respuesta agrupada (<SEG id=k>...</SEG>)
+PATRON_SEGMENTO_AGRUPADO = re.compile(r'<SEG id=(\d+)>(.*?)</SEG>', re.DOTALL)
+
+# Línea que separa el encabezado de la transcripción del contenido
+SEPARADOR_ENCABEZADO = "================"
+
+# Directorio donde se guardan las correcciones de segmentos ya realizadas
+DIRECTORIO_CACHE = Path.home() / ".cache" / "sermon-gen" / "corrections"
+
+# Reintentos ante errores transitorios de la API (límite de peticiones, errores 5xx,
+# cortes de conexión): espera exponencial con jitter entre ESPERA_MINIMA_API y ESPERA_MAXIMA_API segundos
+MAX_REINTENTOS_API = 5
+ESPERA_MINIMA_API = 1
+ESPERA_MAXIMA_API = 30
+
+# HTTP/2 permite multiplexar las peticiones de todos los hilos sobre una misma conexión;
+# httpx solo lo admite si el paquete opcional h2 está instalado (pip install httpx[http2])
+USAR_HTTP2 = importlib.util.find_spec("h2") is not None
+
+# Versión del prompt de corrección: incrementarla al cambiar el sistema o las
+# instrucciones para que las correcciones guardadas con el prompt anterior no se reutilicen
+VERSION_PROMPT = 2
+
+# Tokens de salida reservados por segmento. Una petición agrupada reserva esta cantidad
+# por cada segmento, así que solo caben limite_tokens_salida(modelo) // MAX_TOKENS_SEGMENTO
+# segmentos por grupo antes de alcanzar el límite de salida del modelo
+MAX_TOKENS_SEGMENTO = 4000
+
+# Prompt de sistema y bloque de instrucciones de la corrección, idénticos en todas las
+# peticiones (individuales, agrupadas o en lote). No se marcan con cache_control: juntos
+# rondan los 525 tokens y Anthropic solo guarda en su caché de prompts prefijos de al
+# menos 1024 tokens en Sonnet, así que la marca no tendría efecto
+SISTEMA_CORRECCION = """Eres un corrector de transcripciones EXTREMADAMENTE CONSERVADOR. Tu ÚNICO trabajo es corregir errores ortográficos, gramaticales y de puntuación OBVIOS. NUNCA, bajo ninguna circunstancia, debes modificar el contenido, longitud, estructura o estilo del texto original. Debes devolver un texto casi idéntico al original, con la misma cantidad aproximada de caracteres."""
+
+INSTRUCCIONES_CORRECCION = """
     INSTRUCCIONES CRÍTICAS PARA LA CORRECCIÓN DE TRANSCRIPCIÓN
     
-    Tu tarea es ÚNICAMENTE corregir errores OBVIOS de ortografía, gramática y puntuación en el segmento de transcripción proporcionado.{info_segmento}
+    Tu tarea es ÚNICAMENTE corregir errores OBVIOS de ortografía, gramática y puntuación en el segmento de transcripción proporcionado.
     
     REGLAS ESTRICTAS QUE DEBES SEGUIR AL PIE DE LA LETRA:
     1. NO añadas NINGÚN contenido nuevo, ni siquiera un párrafo introductorio.
@@ -60,7 +80,63 @@ def corregir_con_claude(cliente, transcripcion, modelo, id_segmento=None, total_
     - Digresiones o cambios abruptos de tema (comunes en el habla natural)
     
     IMPORTANTE: Tu respuesta debe mantener la estructura, el contenido y la intención exactos del original. Tu misión es SOLO corregir errores obvios, no mejorar el texto ni hacerlo más coherente o fluido.
+    """
+
+def configurar_argumentos():
+    """Configura los argumentos de línea de comandos."""
+    import argparse
     
+    parser = argparse.ArgumentParser(description='Corrige transcripciones usando Claude')
+    parser.add_argument('--input', type=str, required=True, help='Ruta al archivo de transcripción bruta')
+    parser.add_argument('--output', type=str, help='Ruta para guardar la transcripción corregida')
+    parser.add_argument('--api_key', type=str, help='Clave API de Anthropic (o usar variable de entorno ANTHROPIC_API_KEY)')
+    parser.add_argument('--model', type=str, default="claude-3-7-sonnet-20250219", help='Modelo Claude a utilizar')
+    parser.add_argument('--tamano_segmento', type=int, default=4000, help='Tamaño aproximado de cada segmento en caracteres (segmentos más grandes implican menos peticiones)')
+    parser.add_argument('--max_concurrencia', type=int, default=8, help='Número máximo de segmentos corregidos en paralelo')
+    parser.add_argument('--usar_lotes', action='store_true', help='Enviar los segmentos con la Message Batches API (50%% más barata, sin respuesta inmediata)')
+    parser.add_argument('--max_espera_lote', type=float, default=3600, help='Segundos máximos de espera del lote; si no termina antes se cancela y los segmentos se corrigen con peticiones individuales')
+    parser.add_argument('--agrupar_caracteres', type=int, default=0, help='Agrupar varios segmentos en una misma petición hasta este número de caracteres (0 = una petición por segmento)')
+    parser.add_argument('--sin_cache', action='store_true', help='No reutilizar ni guardar correcciones de ejecuciones anteriores')
+    return parser.parse_args()
+
+@lru_cache(maxsize=None)
+def obtener_cliente(api_key):
+    """
+    Devuelve el cliente de Anthropic para `api_key`, creándolo solo la primera vez.
+    
+    El cliente mantiene un pool de conexiones persistentes (con HTTP/2 si está disponible);
+    reutilizarlo entre segmentos y entre transcripciones evita repetir la conexión TCP y
+    la negociación TLS en cada uso.
+    
+    Los reintentos internos del SDK quedan desactivados (max_retries=0): ante un error
+    transitorio (es_error_transitorio) reintentan transmitir_respuesta y, en el corrector
+    línea por línea, corregir_unidad_con_reintentos, con la espera de espera_reintento.
+    Sumar los del SDK multiplicaría las peticiones. Quien no tenga bucle propio puede
+    recuperarlos con `cliente.with_options(max_retries=2)`.
+    """
+    return Anthropic(api_key=api_key, max_retries=0, http_client=DefaultHttpxClient(http2=USAR_HTTP2))
+
+def leer_transcripcion(ruta_archivo):
+    """Lee el contenido del archivo de transcripción."""
+    try:
+        return Path(ruta_archivo).read_text(encoding='utf-8')
+    except Exception as e:
+        print(f"Error al leer el archivo: {e}")
+        return None
+
+def construir_solicitud(transcripcion, modelo, id_segmento=None, total_segmentos=None):
+    """
+    Construye los parámetros de la petición a Claude para corregir un segmento.
+    
+    El sistema y las instrucciones son fijos; solo el último bloque del mensaje
+    (información y texto del segmento) cambia entre peticiones.
+    """
+    # Información de segmento para incluir en el prompt
+    info_segmento = ""
+    if id_segmento is not None and total_segmentos is not None:
+        info_segmento = f"\n    Este es el segmento {id_segmento} de {total_segmentos} de la transcripción completa.\n"
+    
+    segmento = f"""{info_segmento}
     Segmento de transcripción a corregir (delimita con <INICIO_SEGMENTO> y <FIN_SEGMENTO>):
     
     <INICIO_SEGMENTO>
@@ -70,46 +146,264 @@ def corregir_con_claude(cliente, transcripcion, modelo, id_segmento=None, total_
     EXTREMADAMENTE IMPORTANTE: Tu respuesta debe tener EXACTAMENTE la misma extensión que el texto original o muy similar, conservando todo el contenido. NO agregues ninguna introducción o conclusión. MANTÉN TODO EL CONTENIDO ORIGINAL.
     """
     
-    try:
-        respuesta = cliente.messages.create(
-            model=modelo,
-            max_tokens=4000,
-            temperature=0.05,  # Temperatura más baja para respuestas más conservadoras
-            system=sistema,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+    return {
+        "model": modelo,
+        "max_tokens": min(MAX_TOKENS_SEGMENTO, limite_tokens_salida(modelo)),
+        "temperature": 0.05,  # Temperatura más baja para respuestas más conservadoras
+        "system": SISTEMA_CORRECCION,
+        "messages": [
+            {"role": "user", "content": [
+                {"type": "text", "text": INSTRUCCIONES_CORRECCION},
+                {"type": "text", "text": segmento}
+            ]}
+        ]
+    }
+
+def extraer_texto_corregido(texto_corregido):
+    """Extrae solo el texto corregido, sin comentarios adicionales que Claude pudiera añadir."""
+    # Intentamos eliminar texto adicional que Claude podría añadir antes o después del segmento
+    if "<INICIO_SEGMENTO>" in texto_corregido and "<FIN_SEGMENTO>" in texto_corregido:
+        texto_corregido = PATRON_SEGMENTO.search(texto_corregido)
+        if texto_corregido:
+            texto_corregido = texto_corregido.group(1).strip()
+    
+    # Si no encontramos los delimitadores, tomamos todo el contenido
+    return texto_corregido
+
+def es_error_transitorio(error):
+    """Indica si un error de la API merece reintentarse tras una espera (429, 5xx o conexión)."""
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+def espera_reintento(intento):
+    """Segundos de espera antes del reintento número `intento` + 1: exponencial con jitter."""
+    return random.uniform(ESPERA_MINIMA_API, min(ESPERA_MAXIMA_API, ESPERA_MINIMA_API * 2 ** (intento + 1)))
+
+def transmitir_respuesta(cliente, solicitud, longitud_maxima):
+    """
+    Envía una petición a Claude y devuelve el texto de la respuesta, recibido en streaming.
+    
+    La respuesta se corta en cuanto supera `longitud_maxima` caracteres: una respuesta así
+    no pasaría la verificación de integridad, así que no tiene sentido esperar (ni pagar)
+    el resto de la generación. Los errores transitorios de la API se reintentan con espera
+    exponencial y jitter, para no insistir mientras dura el límite de peticiones.
+    
+    Returns:
+        str: El texto de la respuesta, o None si se interrumpió o la API falló
+    """
+    for intento in range(MAX_REINTENTOS_API + 1):
+        try:
+            fragmentos = []
+            longitud = 0
+            with cliente.messages.stream(**solicitud) as stream:
+                for texto in stream.text_stream:
+                    fragmentos.append(texto)
+                    longitud += len(texto)
+                    if longitud > longitud_maxima:
+                        print(f"La respuesta excede la longitud esperada ({longitud} > {longitud_maxima} caracteres). Se interrumpe la generación.")
+                        return None
+            return "".join(fragmentos)
+        except Exception as e:
+            if intento < MAX_REINTENTOS_API and es_error_transitorio(e):
+                espera = espera_reintento(intento)
+                print(f"Error transitorio de la API de Anthropic ({e}). Reintentando en {espera:.1f} segundos...")
+                time.sleep(espera)
+                continue
+            print(f"Error al comunicarse con la API de Anthropic: {e}")
+            return None
+
+def corregir_con_claude(cliente, transcripcion, modelo, id_segmento=None, total_segmentos=None):
+    """Envía la transcripción a Claude para corrección."""
+    # Margen del 20% (la misma tolerancia de verificar_integridad) más los delimitadores
+    longitud_maxima = int(len(transcripcion) * 1.2) + 64
+    respuesta = transmitir_respuesta(
+        cliente, construir_solicitud(transcripcion, modelo, id_segmento, total_segmentos), longitud_maxima
+    )
+    if respuesta is None:
+        return None
+    return extraer_texto_corregido(respuesta)
+
+def construir_solicitud_agrupada(segmentos, modelo, ids, total_segmentos):
+    """
+    Construye una petición que corrige varios segmentos a la vez.
+    
+    Cada segmento va delimitado por <SEG id=k> y </SEG> (k es su número en la transcripción)
+    y se pide a Claude que devuelva cada corrección con las mismas etiquetas. El sistema y
+    las instrucciones son los mismos que en las peticiones individuales.
+    """
+    bloques = "\n".join(f"<SEG id={id_segmento}>\n{segmento}\n</SEG>" for id_segmento, segmento in zip(ids, segmentos))
+    texto = f"""
+    Se envían {len(segmentos)} segmentos de los {total_segmentos} de la transcripción completa. Corrige cada uno por separado, siguiendo las mismas reglas.
+    
+    Devuelve cada segmento corregido entre las mismas etiquetas que el original (<SEG id=N> y </SEG>), con el mismo número, en el mismo orden y sin ningún texto fuera de las etiquetas.
+    
+{bloques}
+    
+    EXTREMADAMENTE IMPORTANTE: Cada segmento corregido debe tener EXACTAMENTE la misma extensión que su original o muy similar, conservando todo el contenido. NO agregues ninguna introducción o conclusión. MANTÉN TODO EL CONTENIDO ORIGINAL.
+    """
+    
+    solicitud = construir_solicitud("", modelo)
+    solicitud["max_tokens"] = min(MAX_TOKENS_SEGMENTO * len(segmentos), limite_tokens_salida(modelo))
+    solicitud["messages"][0]["content"][1]["text"] = texto
+    return solicitud
+
+def corregir_grupo_con_claude(cliente, segmentos, modelo, indices, total_segmentos):
+    """
+    Corrige varios segmentos en una sola petición a Claude.
+    
+    Args:
+        cliente: Cliente de Anthropic
+        segmentos (list): Todos los segmentos de la transcripción
+        modelo (str): Modelo Claude a utilizar
+        indices (list): Índices de los segmentos que forman el grupo
+        total_segmentos (int): Número total de segmentos de la transcripción
         
-        # Extraer solo el texto corregido, sin comentarios adicionales que Claude pudiera añadir
-        texto_corregido = respuesta.content[0].text
+    Returns:
+        dict: Texto corregido por índice de segmento; faltan los que no vinieron en la respuesta
+    """
+    grupo = [segmentos[i] for i in indices]
+    longitud_maxima = int(sum(len(segmento) for segmento in grupo) * 1.2) + 64 * len(grupo)
+    respuesta = transmitir_respuesta(
+        cliente, construir_solicitud_agrupada(grupo, modelo, [i+1 for i in indices], total_segmentos), longitud_maxima
+    )
+    if respuesta is None:
+        return {}
+    
+    # Reensamblamos por id, ignorando ids que no pertenecen al grupo
+    resultados = {}
+    for coincidencia in PATRON_SEGMENTO_AGRUPADO.finditer(respuesta):
+        indice = int(coincidencia.group(1)) - 1
+        if indice in indices:
+            resultados[indice] = coincidencia.group(2).strip()
+    return resultados
+
+def ruta_cache_correccion(segmento, modelo):
+    """Devuelve la ruta en caché de la corrección de un segmento con un modelo dado."""
+    return ruta_cache(DIRECTORIO_CACHE, modelo, VERSION_PROMPT, segmento)
+
+def corregir_con_lote(cliente, segmentos, modelo, indices=None, espera_inicial=5, espera_maxima=60, max_espera=3600):
+    """
+    Envía todos los segmentos como un único lote de la Message Batches API de Anthropic.
+    
+    Un lote cuesta la mitad que las peticiones individuales y Anthropic lo procesa en
+    paralelo en sus servidores, a cambio de no tener respuesta inmediata: consultamos
+    el estado del lote con espera exponencial hasta que termina. Si no termina en
+    `max_espera` segundos lo cancelamos y devolvemos todos los segmentos sin corregir,
+    para que corregir_segmento los pida con peticiones individuales.
+    
+    Args:
+        cliente: Cliente de Anthropic
+        segmentos (list): Segmentos a corregir
+        modelo (str): Modelo Claude a utilizar
+        indices (list): Índices de los segmentos a enviar (por defecto, todos)
+        espera_inicial (float): Segundos de espera antes de la primera consulta de estado
+        espera_maxima (float): Máximo de segundos entre consultas de estado
+        max_espera (float): Máximo de segundos de espera total antes de cancelar el lote
         
-        # Intentamos eliminar texto adicional que Claude podría añadir antes o después del segmento
-        if "<INICIO_SEGMENTO>" in texto_corregido and "<FIN_SEGMENTO>" in texto_corregido:
-            texto_corregido = re.search(r'<INICIO_SEGMENTO>(.*?)<FIN_SEGMENTO>', texto_corregido, re.DOTALL)
-            if texto_corregido:
-                texto_corregido = texto_corregido.group(1).strip()
+    Returns:
+        list: Texto corregido de cada segmento (None si falló o no se envió), en el mismo orden que `segmentos`
+    """
+    total = len(segmentos)
+    resultados = [None] * total
+    if indices is None:
+        indices = range(total)
+    
+    # Las consultas del lote no pasan por transmitir_respuesta, así que recuperamos los
+    # reintentos del SDK para que un error transitorio no tire por la borda la espera
+    cliente = cliente.with_options(max_retries=2)
+    
+    try:
+        solicitudes = [
+            {"custom_id": f"seg-{i}", "params": construir_solicitud(segmentos[i], modelo, i+1, total)}
+            for i in indices
+        ]
+        lote = cliente.messages.batches.create(requests=solicitudes)
+        print(f"Lote {lote.id} enviado con {len(solicitudes)} segmentos. Esperando resultados...")
         
-        # Si no encontramos los delimitadores, tomamos todo el contenido
-        return texto_corregido
+        inicio = time.monotonic()
+        espera = espera_inicial
+        while lote.processing_status != "ended":
+            restante = max_espera - (time.monotonic() - inicio)
+            if restante <= 0:
+                print(f"El lote {lote.id} no terminó en {max_espera:g} segundos. Se cancela y los segmentos se corrigen con peticiones individuales.")
+                cliente.messages.batches.cancel(lote.id)
+                return resultados
+            time.sleep(min(espera, restante))
+            espera = min(espera * 2, espera_maxima)
+            lote = cliente.messages.batches.retrieve(lote.id)
+        
+        # Reensamblamos los resultados por su custom_id (el lote no garantiza el orden)
+        for resultado in cliente.messages.batches.results(lote.id):
+            indice = int(resultado.custom_id.split("-")[1])
+            if resultado.result.type == "succeeded":
+                resultados[indice] = extraer_texto_corregido(resultado.result.message.content[0].text)
+            else:
+                print(f"El segmento {indice+1} no se completó en el lote ({resultado.result.type}).")
     except Exception as e:
-        print(f"Error al comunicarse con la API de Anthropic: {e}")
-        return None
+        print(f"Error al procesar el lote con la API de Anthropic: {e}")
+    
+    return resultados
+
+class PerfilIntegridad:
+    """
+    Datos del texto original que necesita verificar_integridad.
+    
+    Se calculan una sola vez por texto y se reutilizan en cada reintento, en lugar de
+    volver a dividir el original y extraer sus frases clave en cada verificación.
+    
+    Atributos:
+        longitud (int): Número de caracteres del texto original
+        muestra_frases (list): Hasta 10 frases de 3 palabras (en minúsculas) del original
+    """
+    
+    __slots__ = ("longitud", "muestra_frases")
+    
+    def __init__(self, texto_original):
+        """
+        Calcula el perfil de un texto original.
+        
+        Args:
+            texto_original (str): El texto original
+        """
+        self.longitud = len(texto_original)
+        
+        # Extraemos algunas palabras significativas del original
+        palabras_significativas = set()
+        
+        # Extraemos frases de 3 palabras del texto original 
+        palabras_original = texto_original.split()
+        if len(palabras_original) >= 3:
+            for i in range(len(palabras_original) - 2):
+                frase = " ".join(palabras_original[i:i+3]).lower()
+                # Solo consideramos frases con palabras significativas (evitamos frases comunes)
+                if len(frase) > 15:  # Frases relativamente largas
+                    palabras_significativas.add(frase)
+        
+        # Tomamos una muestra estable de hasta 10 frases (ordenamos antes de muestrear
+        # porque el orden de iteración de un set cambia entre ejecuciones)
+        frases_ordenadas = sorted(palabras_significativas)
+        self.muestra_frases = random.Random(0).sample(frases_ordenadas, min(10, len(frases_ordenadas)))
 
 def verificar_integridad(texto_original, texto_corregido, tolerancia=0.20):
     """
     Verifica que el texto corregido mantenga la integridad del original.
     
     Args:
-        texto_original: El texto original
+        texto_original: El texto original, o su PerfilIntegridad ya calculado
         texto_corregido: El texto corregido
         tolerancia: La diferencia máxima permitida en longitud (por defecto 20%)
         
     Returns:
         bool: True si el texto corregido mantiene la integridad, False en caso contrario
     """
+    if isinstance(texto_original, PerfilIntegridad):
+        perfil = texto_original
+    else:
+        perfil = PerfilIntegridad(texto_original)
+    
     # Verificar longitud similar
-    len_original = len(texto_original)
+    len_original = perfil.longitud
     len_corregido = len(texto_corregido)
     
     # Calculamos la diferencia porcentual
@@ -126,25 +420,14 @@ def verificar_integridad(texto_original, texto_corregido, tolerancia=0.20):
         return False
     
     # Verificar que las palabras clave estén presentes
-    # Extraemos algunas palabras significativas del original
-    palabras_significativas = set()
-    
-    # Extraemos frases de 3 palabras del texto original 
-    palabras_original = texto_original.split()
-    if len(palabras_original) >= 3:
-        for i in range(len(palabras_original) - 2):
-            frase = " ".join(palabras_original[i:i+3]).lower()
-            # Solo consideramos frases con palabras significativas (evitamos frases comunes)
-            if len(frase) > 15:  # Frases relativamente largas
-                palabras_significativas.add(frase)
+    muestra_palabras = perfil.muestra_frases
     
-    # Verificamos que algunas de estas frases estén en el texto corregido
-    palabras_presentes = 0
-    muestra_palabras = list(palabras_significativas)[:10]  # Tomamos hasta 10 frases
+    # Indexamos una sola vez las frases de 3 palabras del texto corregido
+    palabras_corregido = texto_corregido.lower().split()
+    frases_corregido = {" ".join(palabras_corregido[i:i+3]) for i in range(len(palabras_corregido) - 2)}
     
-    for frase in muestra_palabras:
-        if frase.lower() in texto_corregido.lower():
-            palabras_presentes += 1
+    # Verificamos que algunas de estas frases estén en el texto corregido
+    palabras_presentes = sum(1 for frase in muestra_palabras if frase in frases_corregido)
     
     # Si tenemos palabras significativas y menos del 70% están presentes, fallamos
     if len(muestra_palabras) > 0 and palabras_presentes / len(muestra_palabras) < 0.7:
@@ -154,6 +437,35 @@ def verificar_integridad(texto_original, texto_corregido, tolerancia=0.20):
     
     return True
 
+def fin_encabezado(texto):
+    """
+    Devuelve la posición donde termina el encabezado de `texto`: justo después del salto
+    de línea de la línea que contiene SEPARADOR_ENCABEZADO (o el final del texto si es la
+    última línea), o -1 si el texto no tiene separador.
+    """
+    indice_separador = texto.find(SEPARADOR_ENCABEZADO)
+    if indice_separador < 0:
+        return -1
+    fin_linea = texto.find('\n', indice_separador)
+    return len(texto) if fin_linea < 0 else fin_linea + 1
+
+def iterar_lineas(texto):
+    """
+    Recorre las líneas de `texto` una a una, con el mismo resultado que dividirlo por
+    saltos de línea pero sin crear la lista completa.
+    
+    En transcripciones largas evita tener en memoria, a la vez que el texto, una lista
+    con todas sus líneas.
+    """
+    inicio = 0
+    while True:
+        fin = texto.find('\n', inicio)
+        if fin < 0:
+            yield texto[inicio:]
+            return
+        yield texto[inicio:fin]
+        inicio = fin + 1
+
 def dividir_texto(texto, tamano_segmento=1000):
     """Divide el texto en segmentos más pequeños respetando párrafos.
     
@@ -163,62 +475,64 @@ def dividir_texto(texto, tamano_segmento=1000):
     print(f"Texto original: {len(texto)} caracteres")
     print(f"Tamaño de segmento solicitado: {tamano_segmento} caracteres")
     
-    # Identificar el encabezado
-    encabezado = ""
-    lineas = texto.split('\n')
-    
-    # Identificamos el encabezado (primeras líneas hasta la separación)
-    i = 0
-    encabezado_encontrado = False
-    for i, linea in enumerate(lineas):
-        encabezado += linea + "\n"
-        if "================" in linea:
-            i += 1  # Incluimos la línea de separación
-            encabezado_encontrado = True
-            break
+    # Identificamos el encabezado (primeras líneas hasta la separación, incluida)
+    inicio_resto = fin_encabezado(texto)
+    encabezado_encontrado = inicio_resto >= 0
+    if encabezado_encontrado:
+        encabezado = texto[:inicio_resto]
+        if not encabezado.endswith('\n'):
+            encabezado += "\n"
+    else:
+        # Sin separador, el recorrido llega hasta la última línea: todo el texto forma el encabezado
+        encabezado = texto + "\n"
+        inicio_resto = texto.rfind('\n') + 1
     
     # Si no encontramos la línea de separación o el encabezado es muy pequeño,
     # establecemos un límite mínimo para el encabezado
     if not encabezado_encontrado or len(encabezado) < 300:
         # Tomamos al menos 10 líneas como encabezado o hasta 300 caracteres
-        nuevo_i = 0
-        nuevo_encabezado = ""
-        for j, linea in enumerate(lineas):
-            nuevo_encabezado += linea + "\n"
-            nuevo_i = j + 1
-            if len(nuevo_encabezado) >= 300 or j >= 10:
+        fin_nuevo_encabezado = 0
+        for _ in range(11):
+            salto = texto.find('\n', fin_nuevo_encabezado)
+            if salto < 0:
+                # La última línea no termina en salto: la contamos como si lo tuviera
+                fin_nuevo_encabezado = len(texto) + 1
+                break
+            fin_nuevo_encabezado = salto + 1
+            if fin_nuevo_encabezado >= 300:
                 break
         
         # Solo usamos el nuevo encabezado si es más grande que el anterior
-        if len(nuevo_encabezado) > len(encabezado):
-            encabezado = nuevo_encabezado
-            i = nuevo_i
+        if fin_nuevo_encabezado > len(encabezado):
+            encabezado = texto[:fin_nuevo_encabezado - 1] + "\n"
+            inicio_resto = min(fin_nuevo_encabezado, len(texto))
     
     # Diagnóstico del encabezado
     print(f"Encabezado identificado: {len(encabezado)} caracteres")
     
     # El resto del texto lo dividimos en segmentos más pequeños
-    resto_texto = "\n".join(lineas[i:])
+    resto_texto = texto[inicio_resto:]
     
     # Dividimos en segmentos más pequeños para mejor procesamiento
+    # (acumulamos las líneas en una lista y las unimos al cerrar cada segmento,
+    # en lugar de concatenar cadenas, que es cuadrático en textos largos)
     chunks = []
-    texto_actual = ""
+    parrafos_actuales = []
     current_size = 0
     
-    for parrafo in resto_texto.split('\n'):
+    for parrafo in iterar_lineas(resto_texto):
         if current_size + len(parrafo) + 1 > tamano_segmento and current_size > 0:
-            chunks.append(texto_actual)
-            texto_actual = parrafo
+            chunks.append("\n".join(parrafos_actuales))
+            parrafos_actuales = [parrafo] if parrafo else []
             current_size = len(parrafo)
         else:
-            if texto_actual:
-                texto_actual += "\n" + parrafo
-            else:
-                texto_actual = parrafo
+            # Los párrafos vacíos al inicio de un segmento se descartan
+            if parrafos_actuales or parrafo:
+                parrafos_actuales.append(parrafo)
             current_size += len(parrafo) + 1  # +1 por el salto de línea
     
-    if texto_actual:
-        chunks.append(texto_actual)
+    if parrafos_actuales:
+        chunks.append("\n".join(parrafos_actuales))
     
     # Diagnóstico de segmentos antes de añadir encabezado
     print(f"Segmentos creados (sin encabezado): {len(chunks)}")
@@ -232,11 +546,12 @@ def dividir_texto(texto, tamano_segmento=1000):
             fin = min(inicio + tamano_segmento, len(resto_texto))
             # Ajustar para no cortar en medio de una palabra
             if fin < len(resto_texto):
-                # Retroceder hasta encontrar un espacio o salto de línea
-                while fin > inicio and resto_texto[fin] not in [' ', '\n']:
-                    fin -= 1
-                if fin == inicio:  # Si no se encontró un buen punto de corte
-                    fin = min(inicio + tamano_segmento, len(resto_texto))
+                # Buscar hacia atrás el último espacio o salto de línea antes del límite
+                corte = max(resto_texto.rfind(' ', inicio + 1, fin + 1),
+                            resto_texto.rfind('\n', inicio + 1, fin + 1))
+                if corte > inicio:
+                    fin = corte
+                # Si no se encontró un buen punto de corte, se mantiene el límite por tamaño
             
             chunks.append(resto_texto[inicio:fin])
             inicio = fin
@@ -244,9 +559,7 @@ def dividir_texto(texto, tamano_segmento=1000):
         print(f"Segmentos forzados creados: {len(chunks)}")
     
     # Ahora añadimos el encabezado a cada segmento
-    segmentos_con_encabezado = []
-    for segmento in chunks:
-        segmentos_con_encabezado.append(encabezado + segmento)
+    segmentos_con_encabezado = [encabezado + segmento for segmento in chunks]
     
     # Diagnóstico final
     print(f"Segmentos con encabezado: {len(segmentos_con_encabezado)}")
@@ -255,58 +568,142 @@ def dividir_texto(texto, tamano_segmento=1000):
     
     return segmentos_con_encabezado
 
-def corregir_segmentos(cliente, segmentos, modelo):
-    """Corrige múltiples segmentos de transcripción y los combina."""
-    segmentos_corregidos = []
-    segmentos_fallidos = []
+def corregir_segmento(cliente, segmento, modelo, id_segmento, total_segmentos, max_intentos=3, candidato=None, usar_cache=False):
+    """
+    Corrige un único segmento, reintentando si falla la verificación de integridad.
+    
+    Si se recibe un `candidato` (por ejemplo, el resultado de un lote), se verifica como
+    primer intento en lugar de llamar a Claude. Con `usar_cache=True` se reutiliza la
+    corrección de una ejecución anterior si existe, y se guarda la nueva si no.
     
-    # Primera pasada: corregir cada segmento individual
-    for i, segmento in enumerate(segmentos):
-        print(f"Corrigiendo segmento {i+1}/{len(segmentos)}...")
-        intentos = 0
-        max_intentos = 3
-        segmento_corregido = None
+    Returns:
+        str: El segmento corregido, o None si no se pudo corregir tras todos los intentos
+    """
+    print(f"Corrigiendo segmento {id_segmento}/{total_segmentos}...")
+    intentos = 0
+    segmento_corregido = None
+    # El perfil del original no cambia entre intentos, así que lo calculamos una vez
+    perfil = PerfilIntegridad(segmento)
+    
+    # Si ya corregimos este segmento en una ejecución anterior, no volvemos a llamar a Claude
+    if usar_cache:
+        segmento_en_cache = leer_cache(ruta_cache_correccion(segmento, modelo))
+        if segmento_en_cache and verificar_integridad(perfil, segmento_en_cache, tolerancia=0.20):
+            print(f"Segmento {id_segmento}/{total_segmentos} recuperado de la caché.")
+            return segmento_en_cache
+    
+    while intentos < max_intentos and segmento_corregido is None:
+        # Corregimos el segmento (o usamos el candidato en el primer intento)
+        if intentos == 0 and candidato is not None:
+            segmento_corregido = candidato
+        else:
+            segmento_corregido = corregir_con_claude(cliente, segmento, modelo, id_segmento, total_segmentos)
         
-        while intentos < max_intentos and segmento_corregido is None:
-            # Corregimos el segmento
-            segmento_corregido = corregir_con_claude(cliente, segmento, modelo, i+1, len(segmentos))
-            
-            # Verificamos integridad si obtuvimos respuesta
-            if segmento_corregido:
-                if not verificar_integridad(segmento, segmento_corregido, tolerancia=0.20):
-                    print(f"Fallo de integridad en el segmento {i+1}. Reintentando...")
-                    segmento_corregido = None  # Reintentar
-            
-            intentos += 1
+        # Verificamos integridad si obtuvimos respuesta
+        if segmento_corregido:
+            if not verificar_integridad(perfil, segmento_corregido, tolerancia=0.20):
+                print(f"Fallo de integridad en el segmento {id_segmento}. Reintentando...")
+                segmento_corregido = None  # Reintentar
         
+        intentos += 1
+    
+    if usar_cache and segmento_corregido:
+        guardar_cache(ruta_cache_correccion(segmento, modelo), segmento_corregido)
+    
+    return segmento_corregido
+
+def corregir_segmentos(cliente, segmentos, modelo, max_concurrencia=8, usar_lotes=False, usar_cache=True, agrupar_caracteres=0, max_espera_lote=3600):
+    """
+    Corrige múltiples segmentos de transcripción y los combina.
+    
+    Los segmentos son independientes entre sí, así que se envían a Claude en paralelo
+    (como máximo `max_concurrencia` peticiones en curso). Los reintentos de un segmento
+    no bloquean a los demás y el orden original se conserva al combinar.
+    
+    Con `usar_lotes=True` la primera corrección de todos los segmentos se pide en un
+    único lote (más barato pero más lento); solo los segmentos que fallan en el lote
+    se reintentan con peticiones individuales. Si el lote no termina en `max_espera_lote`
+    segundos se cancela y todos los segmentos pasan a peticiones individuales.
+    
+    Con `usar_cache=True` los segmentos corregidos en ejecuciones anteriores (mismo texto,
+    modelo y versión del prompt) se reutilizan sin llamar a la API.
+    
+    Con `agrupar_caracteres` > 0 (y sin lotes) la primera corrección se pide agrupando
+    segmentos consecutivos en una misma petición, hasta ese número de caracteres por grupo.
+    Cada segmento devuelto se verifica por separado; los que faltan en la respuesta o no
+    pasan la verificación se reintentan con peticiones individuales.
+    
+    Returns:
+        tuple: (texto combinado, resumen) donde resumen es un diccionario con los caracteres
+        originales y corregidos acumulados por segmento y la lista de segmentos fallidos
+    """
+    segmentos_corregidos = []
+    segmentos_fallidos = []
+    max_intentos = 3
+    total = len(segmentos)
+    candidatos = [None] * total
+    # Al lote o a los grupos solo enviamos los segmentos que no están ya en la caché
+    pendientes = [
+        i for i, segmento in enumerate(segmentos)
+        if not (usar_cache and ruta_cache_correccion(segmento, modelo).exists())
+    ]
+    if usar_lotes:
+        if pendientes:
+            candidatos = corregir_con_lote(cliente, segmentos, modelo, pendientes, max_espera=max_espera_lote)
+    elif agrupar_caracteres > 0 and pendientes:
+        max_segmentos_por_grupo = max(1, limite_tokens_salida(modelo) // MAX_TOKENS_SEGMENTO)
+        grupos = agrupar_indices(segmentos, pendientes, agrupar_caracteres, max_segmentos_por_grupo)
+        print(f"Enviando {len(pendientes)} segmentos en {len(grupos)} peticiones agrupadas...")
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrencia)) as executor:
+            for resultados_grupo in executor.map(
+                lambda grupo: corregir_grupo_con_claude(cliente, segmentos, modelo, grupo, total), grupos
+            ):
+                for i, segmento_corregido in resultados_grupo.items():
+                    candidatos[i] = segmento_corregido
+    
+    # Primera pasada: corregir cada segmento individual en paralelo
+    # (el cliente de Anthropic es seguro para usarse desde varios hilos)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrencia)) as executor:
+        futuros = [
+            executor.submit(corregir_segmento, cliente, segmento, modelo, i+1, total, max_intentos, candidato, usar_cache)
+            for i, (segmento, candidato) in enumerate(zip(segmentos, candidatos))
+        ]
+        resultados = [futuro.result() for futuro in futuros]
+    
+    caracteres_originales = 0
+    caracteres_corregidos = 0
+    for i, (segmento, segmento_corregido) in enumerate(zip(segmentos, resultados)):
+        caracteres_originales += len(segmento)
         if segmento_corregido:
             segmentos_corregidos.append(segmento_corregido)
+            caracteres_corregidos += len(segmento_corregido)
         else:
             print(f"Error al corregir el segmento {i+1} después de {max_intentos} intentos. Se usará el texto original.")
             segmentos_corregidos.append(segmento)
             segmentos_fallidos.append(i+1)
+            caracteres_corregidos += len(segmento)
     
     # Informamos sobre los segmentos fallidos
     if segmentos_fallidos:
         print(f"Los siguientes segmentos no pudieron ser corregidos y se mantuvieron originales: {segmentos_fallidos}")
     
     # Segunda pasada: extraer el encabezado del primer segmento
-    encabezado = ""
     primer_segmento = segmentos_corregidos[0]
-    lineas_primer_segmento = primer_segmento.split('\n')
     
     # Identificamos el encabezado (hasta la línea con "====")
-    indice_fin_encabezado = 0
-    for i, linea in enumerate(lineas_primer_segmento):
-        encabezado += linea + "\n"
-        if "================" in linea:
-            indice_fin_encabezado = i + 1
-            break
-    
-    # Si no encontramos la línea de separación, tomamos las primeras 5 líneas como encabezado
-    if not encabezado or "================" not in encabezado:
+    fin = fin_encabezado(primer_segmento)
+    if fin >= 0:
+        encabezado = primer_segmento[:fin]
+        if not encabezado.endswith('\n'):
+            encabezado += "\n"
+        contenido_primer_segmento = primer_segmento[fin:]
+        indice_fin_encabezado = encabezado.count('\n')
+    else:
+        # Si no encontramos la línea de separación, tomamos las primeras 5 líneas como encabezado
+        lineas_primer_segmento = primer_segmento.split('\n')
         indice_fin_encabezado = min(5, len(lineas_primer_segmento))
         encabezado = "\n".join(lineas_primer_segmento[:indice_fin_encabezado]) + "\n"
+        contenido_primer_segmento = '\n'.join(lineas_primer_segmento[indice_fin_encabezado:])
     
     # Identificar un patrón común en todos los segmentos (como "El Señor nos ayude")
     patron_comun = ""
@@ -322,47 +719,27 @@ def corregir_segmentos(cliente, segmentos, modelo):
         # Buscamos un patrón común al inicio (primeros 50 caracteres)
         if muestras:
             patron_min_length = 20  # Al menos 20 caracteres para considerar un patrón
-            patron_length = 0
-            for i in range(min(50, min(len(m) for m in muestras))):
-                if all(m[i] == muestras[0][i] for m in muestras):
-                    patron_length = i + 1
-                else:
-                    break
+            patron = os.path.commonprefix(muestras)[:50]
             
-            if patron_length >= patron_min_length:
-                patron_comun = muestras[0][:patron_length]
+            if len(patron) >= patron_min_length:
+                patron_comun = patron
                 print(f"Patrón común identificado: '{patron_comun[:30]}...'")
     
     # Tercera pasada: combinar segmentos eliminando duplicados
-    texto_combinado = ""
-    
-    # Agregamos el encabezado solo una vez
-    texto_combinado += encabezado
-    
-    # Agregamos el contenido del primer segmento (sin encabezado)
-    contenido_primer_segmento = '\n'.join(lineas_primer_segmento[indice_fin_encabezado:])
-    texto_combinado += contenido_primer_segmento
+    # Agregamos el encabezado solo una vez, seguido del contenido del primer segmento (sin encabezado)
+    partes = [encabezado, contenido_primer_segmento]
     
     # Agregamos los demás segmentos, eliminando encabezados y patrones comunes
     for i in range(1, len(segmentos_corregidos)):
         seg = segmentos_corregidos[i]
         
-        # Dividimos el segmento en líneas
-        lineas_seg = seg.split('\n')
-        
-        # Saltamos las líneas del encabezado
-        indice_inicio = 0
-        for j, linea in enumerate(lineas_seg):
-            if "================" in linea:
-                indice_inicio = j + 1
-                break
-        
-        # Si no encontramos la línea de separación, saltamos las primeras líneas (mismo número que en el encabezado)
-        if indice_inicio == 0:
-            indice_inicio = indice_fin_encabezado
-        
         # Extraemos el contenido después del encabezado
-        contenido = '\n'.join(lineas_seg[indice_inicio:])
+        fin = fin_encabezado(seg)
+        if fin >= 0:
+            contenido = seg[fin:]
+        else:
+            # Si no encontramos la línea de separación, saltamos las primeras líneas (mismo número que en el encabezado)
+            contenido = '\n'.join(seg.split('\n')[indice_fin_encabezado:])
         
         # Eliminamos el patrón común si existe
         if patron_comun and contenido.startswith(patron_comun):
@@ -370,27 +747,29 @@ def corregir_segmentos(cliente, segmentos, modelo):
         
         # Añadimos el contenido sin duplicaciones
         if contenido:
-            texto_combinado += "\n" + contenido
-    
-    return texto_combinado
+            partes.append("\n" + contenido)
+    
+    resumen = {
+        "caracteres_originales": caracteres_originales,
+        "caracteres_corregidos": caracteres_corregidos,
+        "segmentos_fallidos": segmentos_fallidos,
+    }
+    return "".join(partes), resumen
 
 def guardar_transcripcion_corregida(transcripcion_corregida, ruta_salida):
     """Guarda la transcripción corregida en un archivo."""
     try:
-        # Crear directorio si no existe
-        directorio = os.path.dirname(ruta_salida)
-        if directorio and not os.path.exists(directorio):
-            os.makedirs(directorio)
-            
-        with open(ruta_salida, 'w', encoding='utf-8') as archivo:
-            archivo.write(transcripcion_corregida)
+        # Crear directorio si no existe (sin comprobar antes si existe, para evitar carreras)
+        ruta = Path(ruta_salida)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(transcripcion_corregida, encoding='utf-8')
         print(f"Transcripción corregida guardada en: {ruta_salida}")
         return True
     except Exception as e:
         print(f"Error al guardar la transcripción corregida: {e}")
         return False
 
-def corregir_transcripcion_por_segmentos(cliente_anthropic, ruta_archivo, ruta_salida, modelo="claude-3-7-sonnet-20250219", tamano_segmento=1000):
+def corregir_transcripcion_por_segmentos(cliente_anthropic, ruta_archivo, ruta_salida, modelo="claude-3-7-sonnet-20250219", tamano_segmento=1000, max_concurrencia=8, usar_lotes=False, usar_cache=True, agrupar_caracteres=0, max_espera_lote=3600):
     """Corrige una transcripción dividiéndola en segmentos."""
     # Leer la transcripción completa
     transcripcion_completa = leer_transcripcion(ruta_archivo)
@@ -406,16 +785,15 @@ def corregir_transcripcion_por_segmentos(cliente_anthropic, ruta_archivo, ruta_s
     if len(segmentos) <= 1 and len(transcripcion_completa) > tamano_segmento * 2:
         print("ADVERTENCIA: La transcripción no se dividió correctamente. Forzando división.")
         # Dividir el texto en fragmentos de tamaño fijo ignorando párrafos
-        texto_chars = list(transcripcion_completa)
         encabezado = transcripcion_completa[:min(500, len(transcripcion_completa))]  # Tomar los primeros 500 caracteres como encabezado
-        chunks = [texto_chars[i:i+tamano_segmento] for i in range(0, len(texto_chars), tamano_segmento)]
-        segmentos = [encabezado + ''.join(chunk) for chunk in chunks]
+        segmentos = [encabezado + transcripcion_completa[i:i+tamano_segmento]
+                     for i in range(0, len(transcripcion_completa), tamano_segmento)]
         print(f"Segmentos forzados creados: {len(segmentos)}")
     
     # Corregir segmentos
     print(f"Enviando segmentos a {modelo} para corrección...")
     inicio = time.time()
-    transcripcion_corregida = corregir_segmentos(cliente_anthropic, segmentos, modelo)
+    transcripcion_corregida, resumen = corregir_segmentos(cliente_anthropic, segmentos, modelo, max_concurrencia, usar_lotes, usar_cache, agrupar_caracteres, max_espera_lote)
     fin = time.time()
     
     if not transcripcion_corregida:
@@ -423,10 +801,15 @@ def corregir_transcripcion_por_segmentos(cliente_anthropic, ruta_archivo, ruta_s
     
     print(f"Corrección completada en {fin - inicio:.2f} segundos")
     
-    # Verificar integridad final
-    if not verificar_integridad(transcripcion_completa, transcripcion_corregida, tolerancia=0.20):
-        print("ADVERTENCIA: La transcripción corregida final presenta diferencias significativas con el original.")
-        print("Se recomienda revisar manualmente el resultado.")
+    # Verificar integridad final: si todos los segmentos pasaron su verificación basta con
+    # los totales acumulados; el documento completo solo se revisa si alguno falló
+    if resumen["segmentos_fallidos"]:
+        if not verificar_integridad(transcripcion_completa, transcripcion_corregida, tolerancia=0.20):
+            print("ADVERTENCIA: La transcripción corregida final presenta diferencias significativas con el original.")
+            print("Se recomienda revisar manualmente el resultado.")
+    elif resumen["caracteres_originales"]:
+        diferencia = (resumen["caracteres_corregidos"] - resumen["caracteres_originales"]) / resumen["caracteres_originales"]
+        print(f"Todos los segmentos pasaron la verificación de integridad (diferencia de longitud: {diferencia * 100:.2f}%).")
     
     # Guardar resultado
     exito = guardar_transcripcion_corregida(transcripcion_corregida, ruta_salida)
@@ -459,13 +842,16 @@ def main():
         print("Error: Se requiere una clave API de Anthropic. Proporcione --api_key o establezca la variable de entorno ANTHROPIC_API_KEY.")
         return
     
-    # Inicializar el cliente de Anthropic
-    cliente = Anthropic(api_key=api_key)
+    # Obtener el cliente de Anthropic (compartido con cualquier otro uso en el proceso)
+    cliente = obtener_cliente(api_key)
     
     # Procesar la transcripción por segmentos
     print(f"Leyendo transcripción: {args.input}")
     exito, caracteres_original, caracteres_corregido = corregir_transcripcion_por_segmentos(
-        cliente, args.input, args.output, args.model, tamano_segmento=tamano_segmento
+        cliente, args.input, args.output, args.model, tamano_segmento=args.tamano_segmento,
+        max_concurrencia=args.max_concurrencia, usar_lotes=args.usar_lotes,
+        usar_cache=not args.sin_cache, agrupar_caracteres=args.agrupar_caracteres,
+        max_espera_lote=args.max_espera_lote
     )
     
     if exito:
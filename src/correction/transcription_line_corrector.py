@@ -7,15 +7,168 @@ sin alterar el formato general.
 """
 
 import os
+import re
 import json
 import time
-from anthropic import Anthropic
+import threading
+import difflib
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from anthropic import RateLimitError
+
+# El cliente (un único pool de conexiones), la caché y la agrupación se comparten con el
+# corrector por segmentos. Al ejecutar este archivo como script, src/correction es el
+# primer elemento de sys.path.
+try:
+    from src.correction.transcription_corrector import obtener_cliente, es_error_transitorio, espera_reintento
+    from src.correction.comun import ruta_cache, leer_cache, guardar_cache, agrupar_indices, limite_tokens_salida
+except ImportError:
+    from transcription_corrector import obtener_cliente, es_error_transitorio, espera_reintento
+    from comun import ruta_cache, leer_cache, guardar_cache, agrupar_indices, limite_tokens_salida
+
+# orjson es opcional: si está instalado se usa para leer el JSON de la transcripción
+# (varias veces más rápido con archivos grandes); si no, usamos el módulo json estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Final de frase: el espacio que sigue a ".", "?" o "!" (el espacio se descarta al dividir)
+PATRON_FIN_FRASE = re.compile(r"""
+    (?<=[.?!])   # justo después de un signo de final de frase
+    [ ]          # un único espacio (un salto de línea no divide la frase)
+""", re.VERBOSE)
+
+# Similitud mínima de caracteres (SequenceMatcher.quick_ratio) entre una unidad y su
+# corrección: por debajo, Claude ha reescrito el texto aunque conserve la longitud
+UMBRAL_SIMILITUD = 0.85
+
+# Palabras de una unidad, para comprobar si todas son conocidas
+PATRON_PALABRA = re.compile(r'\w+')
+
+# Nombres y términos bíblicos habituales en los sermones (en minúsculas), que un
+# diccionario general de español no suele incluir
+TERMINOS_BIBLICOS = frozenset({
+    "génesis", "éxodo", "levítico", "números", "deuteronomio", "josué", "jueces", "rut",
+    "samuel", "reyes", "crónicas", "esdras", "nehemías", "ester", "job", "salmo", "salmos",
+    "proverbios", "eclesiastés", "cantares", "isaías", "jeremías", "lamentaciones",
+    "ezequiel", "daniel", "oseas", "joel", "amós", "abdías", "jonás", "miqueas", "nahúm",
+    "habacuc", "sofonías", "hageo", "zacarías", "malaquías", "mateo", "marcos", "lucas",
+    "juan", "hechos", "romanos", "corintios", "gálatas", "efesios", "filipenses",
+    "colosenses", "tesalonicenses", "timoteo", "tito", "filemón", "hebreos", "santiago",
+    "pedro", "judas", "apocalipsis", "jesús", "jesucristo", "cristo", "mesías", "jehová",
+    "yahvé", "emanuel", "abraham", "isaac", "jacob", "moisés", "aarón", "david", "salomón",
+    "elías", "eliseo", "pablo", "saulo", "bernabé", "silas", "lázaro", "nicodemo",
+    "zaqueo", "pilato", "herodes", "israel", "jerusalén", "judea", "galilea", "nazaret",
+    "belén", "egipto", "babilonia", "sion", "canaán", "getsemaní", "gólgota", "calvario",
+    "fariseos", "saduceos", "escribas", "levitas", "apóstol", "apóstoles", "evangelio",
+    "aleluya", "amén", "hosanna", "pentecostés", "pascua",
+})
+
+# Directorio donde se guardan las unidades ya corregidas, para no volver a pedirlas al repetir una corrección
+DIRECTORIO_CACHE = Path.home() / ".cache" / "sermon-gen" / "line_corrections"
+
+# Versión del prompt de corrección: incrementarla al cambiar el sistema o las
+# instrucciones para que las correcciones guardadas con el prompt anterior no se reutilicen
+VERSION_PROMPT = 1
+
+# Tokens de salida reservados como mínimo por unidad. Una petición agrupada los reserva
+# por cada unidad, así que agrupamos como mucho limite_tokens_salida(modelo) // MAX_TOKENS_UNIDAD
+# unidades para no pasar del límite de salida del modelo
+MAX_TOKENS_UNIDAD = 1000
+
+# Prompt de sistema e instrucciones de corrección, idénticos en todas las peticiones.
+# No se marcan con cache_control: juntos rondan los 300 tokens y Anthropic solo guarda
+# en su caché de prompts prefijos de al menos 1024 tokens en Sonnet
+SISTEMA_CORRECCION = """Eres un corrector EXTREMADAMENTE CONSERVADOR de transcripciones de sermones religiosos. 
+Tu ÚNICA tarea es corregir errores ortográficos, gramaticales, y términos religiosos mal transcritos, 
+MANTENIENDO EXACTAMENTE la misma estructura, formato y contenido."""
+
+INSTRUCCIONES_CORRECCION = """
+INSTRUCCIONES DE CORRECCIÓN ESTRICTAS:
+
+Corrige ÚNICAMENTE los siguientes tipos de errores en este fragmento de un sermón:
+1. Errores ortográficos básicos (palabras mal escritas)
+2. Errores gramaticales evidentes
+3. Términos bíblicos o teológicos incorrectos, incluyendo:
+   - Nombres de libros bíblicos mal escritos o confundidos
+   - Referencias incorrectas como "avenida del Señor" que debería ser "venida del Señor"
+   - Palabras teológicas incorrectas o mal transcritas
+4. Nombres propios de personas bíblicas o religiosas conocidas
+
+REGLAS QUE DEBES SEGUIR ABSOLUTAMENTE:
+1. NO CAMBIÉS la estructura o formato del texto
+2. NO AGREGUES ni ELIMINES contenido
+3. NO ALTERES los saltos de línea
+4. NO REESCRIBAS ni PARAFRASEES el texto
+5. MANTÉN los términos y expresiones propias del predicador aunque parezcan coloquiales
+6. PRESERVA las repeticiones intencionales (como palabras repetidas)
+7. NO INTENTES mejorar la claridad o fluidez del texto
+
+"""
+
+class LimitadorTasa:
+    """
+    Limitador de peticiones y tokens por minuto (cubeta de fichas), seguro entre hilos.
+    
+    Antes de cada petición se reservan una petición y los tokens estimados; si no hay
+    suficientes, el hilo espera a que las cubetas se rellenen (a rpm/60 y tpm/60 por
+    segundo) en lugar de enviar la petición y recibir un error 429.
+    
+    Atributos:
+        rpm (int): Peticiones por minuto permitidas (0 = sin límite)
+        tpm (int): Tokens por minuto permitidos (0 = sin límite)
+    """
+    
+    def __init__(self, rpm=40, tpm=16000):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.peticiones_disponibles = float(rpm)
+        self.tokens_disponibles = float(tpm)
+        self.ultima_recarga = time.monotonic()
+        self.bloqueo = threading.Lock()
+    
+    def recargar(self):
+        """Rellena las cubetas según el tiempo transcurrido (llamar con el bloqueo tomado)."""
+        ahora = time.monotonic()
+        transcurrido = ahora - self.ultima_recarga
+        self.ultima_recarga = ahora
+        self.peticiones_disponibles = min(self.rpm, self.peticiones_disponibles + transcurrido * self.rpm / 60)
+        self.tokens_disponibles = min(self.tpm, self.tokens_disponibles + transcurrido * self.tpm / 60)
+    
+    def adquirir(self, tokens_estimados):
+        """Espera hasta poder enviar una petición de `tokens_estimados` tokens y los reserva."""
+        # Una petición mayor que la cubeta entera solo espera a que esté llena
+        tokens = min(tokens_estimados, self.tpm)
+        while True:
+            with self.bloqueo:
+                self.recargar()
+                faltan_peticiones = (1 - self.peticiones_disponibles) if self.rpm else 0
+                faltan_tokens = (tokens - self.tokens_disponibles) if self.tpm else 0
+                if faltan_peticiones <= 0 and faltan_tokens <= 0:
+                    if self.rpm:
+                        self.peticiones_disponibles -= 1
+                    if self.tpm:
+                        self.tokens_disponibles -= tokens
+                    return
+                espera = max(
+                    faltan_peticiones * 60 / self.rpm if self.rpm else 0,
+                    faltan_tokens * 60 / self.tpm if self.tpm else 0
+                )
+            time.sleep(espera)
+    
+    def penalizar(self):
+        """Vacía las cubetas tras un error 429, para que las siguientes peticiones esperen."""
+        with self.bloqueo:
+            self.recargar()
+            self.peticiones_disponibles = min(self.peticiones_disponibles, 0)
+            self.tokens_disponibles = min(self.tokens_disponibles, 0)
 
 def leer_transcripcion(ruta_archivo):
     """Lee el contenido del archivo de transcripción."""
     try:
-        with open(ruta_archivo, 'r', encoding='utf-8') as archivo:
-            return archivo.read()
+        return Path(ruta_archivo).read_text(encoding='utf-8')
     except Exception as e:
         print(f"Error al leer el archivo: {e}")
         return None
@@ -23,8 +176,9 @@ def leer_transcripcion(ruta_archivo):
 def leer_json_transcripcion(ruta_json):
     """Lee el archivo JSON de transcripción que contiene segmentos con marcas de tiempo."""
     try:
-        with open(ruta_json, 'r', encoding='utf-8') as archivo:
-            return json.load(archivo)
+        if orjson:
+            return orjson.loads(Path(ruta_json).read_bytes())
+        return json.loads(Path(ruta_json).read_text(encoding='utf-8'))
     except Exception as e:
         print(f"Error al leer el archivo JSON: {e}")
         return None
@@ -46,93 +200,119 @@ def extraer_limites_segmentos(datos_json):
     # Extraer los segmentos
     segmentos = datos_json.get('segments', [])
     
-    # Calcular los límites en caracteres (aproximado)
-    limites = []
-    texto_acumulado = ""
-    
-    for i, segmento in enumerate(segmentos):
-        # Omitimos el último segmento ya que no hay límite después de él
-        if i < len(segmentos) - 1:
-            texto_acumulado += segmento.get('text', '') + " "
-            limites.append(len(texto_acumulado))
+    # Calcular los límites en caracteres (aproximado): suma acumulada de la longitud de
+    # cada segmento más el espacio que los separa, sin construir el texto concatenado.
+    # Omitimos el último segmento ya que no hay límite después de él
+    limites = list(accumulate(len(segmento.get('text', '')) + 1 for segmento in segmentos[:-1]))
     
     print(f"Identificados {len(limites)} límites de segmentos")
     return limites
 
-def dividir_en_unidades_pequenas(texto):
+def dividir_en_unidades_pequenas(texto, max_tamano=400):
     """
     Divide el texto en unidades más pequeñas para una corrección más efectiva.
     
     Args:
         texto (str): Texto completo a dividir
+        max_tamano (int): Máximo número de caracteres por unidad
         
     Returns:
         list: Lista de unidades de texto pequeñas
     """
-    # 1. Primero, separamos el encabezado
-    lineas = texto.split('\n')
-    encabezado = []
-    contenido = []
-    
-    # Identificar el encabezado (asumimos que está antes de la línea con ======)
-    en_encabezado = True
-    for linea in lineas:
-        if "=====" in linea:
-            encabezado.append(linea)
-            en_encabezado = False
-            continue
-        
-        if en_encabezado:
-            encabezado.append(linea)
-        else:
-            contenido.append(linea)
+    # 1. Primero, separamos el encabezado: todo hasta el final de la primera línea con =====
+    # (lo localizamos con partition, sin partir el texto completo en una lista de líneas)
+    antes, separador, despues = texto.partition("=====")
+    resto_linea, salto, texto_contenido = despues.partition('\n')
+    if not (separador and salto):
+        # Sin línea separadora (o si es la última línea), todo el texto es encabezado
+        encabezado_texto = texto
+        texto_contenido = ''
+    else:
+        encabezado_texto = antes + separador + resto_linea
+        if "=====" in texto_contenido:
+            # Las líneas separadoras posteriores también se consideran parte del encabezado
+            lineas = texto_contenido.split('\n')
+            encabezado_texto = '\n'.join([encabezado_texto] + [linea for linea in lineas if "=====" in linea])
+            texto_contenido = '\n'.join(linea for linea in lineas if "=====" not in linea)
     
     # 2. Dividimos el contenido en pequeñas unidades, aproximadamente por frases
-    # (Consideramos frases como unidades terminadas en ".", "?", o "!")
-    texto_contenido = '\n'.join(contenido)
-    
-    # Reemplazamos los finales de frase seguidos de salto de línea para preservarlos
-    texto_contenido = texto_contenido.replace('.\n', '.||SALTO||')
-    texto_contenido = texto_contenido.replace('?\n', '?||SALTO||')
-    texto_contenido = texto_contenido.replace('!\n', '!||SALTO||')
-    
-    # Dividimos por finales de frase
-    fragmentos_raw = []
-    for fragmento in texto_contenido.replace('. ', '.|SPLIT|').replace('? ', '?|SPLIT|').replace('! ', '!|SPLIT|').split('|SPLIT|'):
-        # Restauramos los saltos de línea
-        fragmento = fragmento.replace('||SALTO||', '\n')
-        if fragmento.strip():
-            fragmentos_raw.append(fragmento.strip())
-    
-    # 3. Agrupamos frases en unidades de tamaño razonable (300-400 caracteres máximo)
+    # (Consideramos frases como unidades terminadas en ".", "?", o "!" seguidas de un espacio;
+    # un final de frase seguido de salto de línea no divide y el salto se conserva)
+    fragmentos_raw = [
+        fragmento.strip()
+        for fragmento in PATRON_FIN_FRASE.split(texto_contenido)
+        if fragmento.strip()
+    ]
+    
+    # 3. Agrupamos frases en unidades de tamaño razonable (hasta max_tamano caracteres)
+    # (acumulamos las frases en una lista y llevamos la longitud de la unidad como un entero,
+    # en lugar de concatenar cadenas, que es cuadrático en textos largos)
     unidades = []
-    unidad_actual = ""
-    max_tamano = 400  # Máximo número de caracteres por unidad
+    frases_actuales = []
+    longitud_actual = 0
     
     for fragmento in fragmentos_raw:
-        if len(unidad_actual) + len(fragmento) <= max_tamano:
-            if unidad_actual:
-                unidad_actual += " " + fragmento
-            else:
-                unidad_actual = fragmento
+        if longitud_actual + len(fragmento) <= max_tamano:
+            if frases_actuales:
+                longitud_actual += 1  # Espacio que las une
+            frases_actuales.append(fragmento)
+            longitud_actual += len(fragmento)
         else:
-            if unidad_actual:  # Guardamos la unidad actual antes de empezar una nueva
-                unidades.append(unidad_actual)
-            unidad_actual = fragmento
+            if frases_actuales:  # Guardamos la unidad actual antes de empezar una nueva
+                unidades.append(" ".join(frases_actuales))
+            frases_actuales = [fragmento]
+            longitud_actual = len(fragmento)
     
     # No olvidamos la última unidad
-    if unidad_actual:
-        unidades.append(unidad_actual)
+    if frases_actuales:
+        unidades.append(" ".join(frases_actuales))
     
     # 4. El encabezado lo dejamos como una unidad separada
-    encabezado_texto = '\n'.join(encabezado)
     if encabezado_texto.strip():
         unidades.insert(0, encabezado_texto)
     
     print(f"Texto dividido en {len(unidades)} unidades pequeñas")
     return unidades
 
-def corregir_unidad(cliente, unidad, modelo="claude-3-7-sonnet-20250219"):
+def cargar_diccionario(ruta_diccionario):
+    """
+    Carga una lista de palabras expandida: una forma por línea, con plurales y formas verbales.
+    
+    Un .dic de hunspell no sirve tal cual: solo trae raíces con marcas de afijos
+    ("hermano/S"), así que "hermanos" o "vamos" nunca estarían en el conjunto y casi
+    ninguna unidad contaría como limpia. Hay que expandirlo antes, p. ej. con
+    `unmunch es_ES.dic es_ES.aff > es_ES.txt`.
+    
+    Returns:
+        frozenset: Palabras en minúsculas, o None si no se pudo leer el archivo o no está expandido
+    """
+    try:
+        with open(ruta_diccionario, 'r', encoding='utf-8') as archivo:
+            palabras = frozenset(linea.strip().lower() for linea in archivo)
+    except Exception as e:
+        print(f"Error al leer el diccionario: {e}")
+        return None
+    if any('/' in palabra for palabra in palabras):
+        print("Error: el diccionario tiene marcas de afijos de hunspell (palabra/afijos). Expándalo antes con unmunch; no se filtrarán unidades.")
+        return None
+    print(f"Diccionario cargado: {len(palabras)} palabras")
+    return palabras
+
+def es_unidad_limpia(unidad, diccionario):
+    """
+    Indica si todas las palabras de la unidad son números, términos bíblicos o palabras
+    del diccionario: en ese caso es casi seguro que Claude no cambiaría nada.
+    """
+    return all(
+        palabra.isdigit() or palabra in diccionario or palabra in TERMINOS_BIBLICOS
+        for palabra in PATRON_PALABRA.findall(unidad.lower())
+    )
+
+def ruta_cache_unidad(unidad, modelo):
+    """Devuelve la ruta en caché de la corrección de una unidad con un modelo dado."""
+    return ruta_cache(DIRECTORIO_CACHE, modelo, VERSION_PROMPT, unidad)
+
+def corregir_unidad(cliente, unidad, modelo="claude-3-7-sonnet-20250219", limitador=None, usar_cache=False):
     """
     Corrige una unidad individual de texto usando Claude, manteniendo su estructura.
     
@@ -140,6 +320,8 @@ def corregir_unidad(cliente, unidad, modelo="claude-3-7-sonnet-20250219"):
         cliente: Cliente de Anthropic
         unidad (str): Unidad de texto a corregir
         modelo (str): Modelo Claude a utilizar
+        limitador (LimitadorTasa): Limitador de peticiones y tokens por minuto (opcional)
+        usar_cache (bool): Reutilizar la corrección de una ejecución anterior y guardar la nueva
         
     Returns:
         str: Unidad corregida
@@ -148,131 +330,320 @@ def corregir_unidad(cliente, unidad, modelo="claude-3-7-sonnet-20250219"):
     if not unidad or len(unidad) < 10:
         return unidad
     
-    sistema = """Eres un corrector EXTREMADAMENTE CONSERVADOR de transcripciones de sermones religiosos. 
-Tu ÚNICA tarea es corregir errores ortográficos, gramaticales, y términos religiosos mal transcritos, 
-MANTENIENDO EXACTAMENTE la misma estructura, formato y contenido."""
+    # Si ya corregimos esta unidad en una ejecución anterior, no volvemos a llamar a Claude
+    if usar_cache:
+        unidad_en_cache = leer_cache(ruta_cache_unidad(unidad, modelo))
+        if unidad_en_cache is not None:
+            return unidad_en_cache
     
-    prompt = f"""
-INSTRUCCIONES DE CORRECCIÓN ESTRICTAS:
-
-Corrige ÚNICAMENTE los siguientes tipos de errores en este fragmento de un sermón:
-1. Errores ortográficos básicos (palabras mal escritas)
-2. Errores gramaticales evidentes
-3. Términos bíblicos o teológicos incorrectos, incluyendo:
-   - Nombres de libros bíblicos mal escritos o confundidos
-   - Referencias incorrectas como "avenida del Señor" que debería ser "venida del Señor"
-   - Palabras teológicas incorrectas o mal transcritas
-4. Nombres propios de personas bíblicas o religiosas conocidas
-
-REGLAS QUE DEBES SEGUIR ABSOLUTAMENTE:
-1. NO CAMBIÉS la estructura o formato del texto
-2. NO AGREGUES ni ELIMINES contenido
-3. NO ALTERES los saltos de línea
-4. NO REESCRIBAS ni PARAFRASEES el texto
-5. MANTÉN los términos y expresiones propias del predicador aunque parezcan coloquiales
-6. PRESERVA las repeticiones intencionales (como palabras repetidas)
-7. NO INTENTES mejorar la claridad o fluidez del texto
-
-TEXTO A CORREGIR:
+    prompt = f"""TEXTO A CORREGIR:
 {unidad}
 
 RESPONDE ÚNICAMENTE CON EL TEXTO CORREGIDO, SIN COMENTARIOS ADICIONALES.
 """
     
+    if limitador:
+        # Estimación aproximada: unos 4 caracteres por token
+        limitador.adquirir((len(SISTEMA_CORRECCION) + len(INSTRUCCIONES_CORRECCION) + len(prompt)) // 4)
+    
     try:
-        respuesta = cliente.messages.create(
+        # Recibimos la respuesta en streaming para cortarla en cuanto sea claramente más
+        # larga que el original: se descartaría igualmente, así que no esperamos al resto
+        fragmentos = []
+        longitud = 0
+        with cliente.messages.stream(
             model=modelo,
-            max_tokens=1000,
+            # Margen para unidades grandes (--max_unidad), sin pasar del límite del modelo
+            max_tokens=min(max(MAX_TOKENS_UNIDAD, len(unidad) // 2), limite_tokens_salida(modelo)),
             temperature=0.1,  # Temperatura muy baja para ser conservador
-            system=sistema,
+            system=SISTEMA_CORRECCION,
             messages=[
-                {"role": "user", "content": prompt}
+                {"role": "user", "content": [
+                    {"type": "text", "text": INSTRUCCIONES_CORRECCION},
+                    {"type": "text", "text": prompt}
+                ]}
             ]
-        )
+        ) as stream:
+            for texto in stream.text_stream:
+                fragmentos.append(texto)
+                longitud += len(texto)
+                if longitud - len(unidad) > len(unidad) * 0.2:
+                    print(f"Advertencia: La corrección cambió significativamente la longitud del texto. Usando original.")
+                    return unidad
         
         # Extraer solo el texto corregido
-        texto_corregido = respuesta.content[0].text
+        texto_corregido = "".join(fragmentos)
         
         # Si la corrección cambia significativamente la longitud, usamos el original
         if abs(len(texto_corregido) - len(unidad)) > len(unidad) * 0.2:
             print(f"Advertencia: La corrección cambió significativamente la longitud del texto. Usando original.")
             return unidad
         
+        # Si la corrección tiene la misma longitud pero otros caracteres, también usamos el original
+        if difflib.SequenceMatcher(None, unidad, texto_corregido).quick_ratio() < UMBRAL_SIMILITUD:
+            print(f"Advertencia: La corrección reescribió el texto. Usando original.")
+            return unidad
+        
+        # Solo guardamos correcciones aceptadas, para reintentar las rechazadas en la próxima ejecución
+        if usar_cache:
+            guardar_cache(ruta_cache_unidad(unidad, modelo), texto_corregido)
+        
         return texto_corregido
     
+    except RateLimitError:
+        # Límite superado: frenamos al resto de hilos y dejamos que se reintente la unidad
+        if limitador:
+            limitador.penalizar()
+        raise
     except Exception as e:
+        # Errores transitorios (5xx, 529 de sobrecarga, cortes de conexión): el cliente no
+        # reintenta por su cuenta, así que los reintenta corregir_unidad_con_reintentos
+        if es_error_transitorio(e):
+            raise
         print(f"Error al comunicarse con la API de Anthropic: {e}")
         return unidad
 
-def corregir_transcripcion_por_unidades(cliente, texto_completo, limites_segmentos=None, modelo="claude-3-7-sonnet-20250219"):
+def corregir_grupo_unidades(cliente, unidades, indices, modelo="claude-3-7-sonnet-20250219", limitador=None, usar_cache=False):
+    """
+    Corrige varias unidades en una sola petición, pidiendo la respuesta como un array JSON.
+    
+    Cada unidad se envía entre etiquetas <u id="N"> y Claude debe devolver
+    [{"id": N, "text": "..."}, ...]. A cada unidad devuelta se le aplica el mismo control
+    de longitud que en corregir_unidad.
+    
+    Args:
+        cliente: Cliente de Anthropic
+        unidades (list): Todas las unidades de la transcripción
+        indices (list): Índices de las unidades que forman el grupo
+        modelo (str): Modelo Claude a utilizar
+        limitador (LimitadorTasa): Limitador de peticiones y tokens por minuto (opcional)
+        usar_cache (bool): Guardar en la caché las correcciones aceptadas
+        
+    Returns:
+        dict: Unidad corregida por índice; faltan las que no vinieron en la respuesta
+              (todas si la respuesta no se pudo interpretar)
+    """
+    bloques = "\n".join(f'<u id="{i+1}">{unidades[i]}</u>' for i in indices)
+    prompt = f"""TEXTOS A CORREGIR (cada uno entre <u id="N"> y </u>, corrígelos por separado):
+{bloques}
+
+RESPONDE ÚNICAMENTE CON UN ARRAY JSON CON UN OBJETO POR TEXTO, EN EL MISMO ORDEN:
+[{{"id": N, "text": "texto corregido"}}, ...]
+SIN COMENTARIOS ADICIONALES.
+"""
+    
+    if limitador:
+        # Estimación aproximada: unos 4 caracteres por token
+        limitador.adquirir((len(SISTEMA_CORRECCION) + len(INSTRUCCIONES_CORRECCION) + len(prompt)) // 4)
+    
+    # Reservamos los mismos tokens por unidad que corregir_unidad, sin pasar del límite de
+    # salida del modelo
+    max_tokens = min(
+        sum(max(MAX_TOKENS_UNIDAD, len(unidades[i]) // 2) for i in indices),
+        limite_tokens_salida(modelo)
+    )
+    
+    try:
+        # Con un max_tokens tan alto la API exige streaming (sin él rechaza la petición)
+        with cliente.messages.stream(
+            model=modelo,
+            max_tokens=max_tokens,
+            temperature=0.1,  # Temperatura muy baja para ser conservador
+            system=SISTEMA_CORRECCION,
+            messages=[
+                {"role": "user", "content": [
+                    {"type": "text", "text": INSTRUCCIONES_CORRECCION},
+                    {"type": "text", "text": prompt}
+                ]}
+            ]
+        ) as stream:
+            texto = "".join(stream.text_stream)
+        # Ignoramos cualquier texto que Claude añada antes o después del array
+        correcciones = json.loads(texto[texto.find('['):texto.rfind(']') + 1])
+    except RateLimitError:
+        if limitador:
+            limitador.penalizar()
+        return {}
+    except Exception as e:
+        print(f"Error al corregir el grupo de unidades {indices[0]+1}-{indices[-1]+1}: {e}")
+        return {}
+    
+    resultados = {}
+    for correccion in correcciones:
+        try:
+            indice = int(correccion["id"]) - 1
+            texto_corregido = correccion["text"]
+        except (TypeError, KeyError, ValueError):
+            continue
+        if indice not in indices or not isinstance(texto_corregido, str):
+            continue
+        
+        # Si la corrección cambia significativamente la longitud, usamos el original
+        unidad = unidades[indice]
+        if abs(len(texto_corregido) - len(unidad)) > len(unidad) * 0.2:
+            print(f"Advertencia: La corrección de la unidad {indice+1} cambió significativamente la longitud del texto. Usando original.")
+            texto_corregido = unidad
+        elif difflib.SequenceMatcher(None, unidad, texto_corregido).quick_ratio() < UMBRAL_SIMILITUD:
+            print(f"Advertencia: La corrección de la unidad {indice+1} reescribió el texto. Usando original.")
+            texto_corregido = unidad
+        elif usar_cache:
+            guardar_cache(ruta_cache_unidad(unidad, modelo), texto_corregido)
+        resultados[indice] = texto_corregido
+    return resultados
+
+def corregir_unidad_con_reintentos(cliente, unidad, modelo, id_unidad, total_unidades, limitador=None, usar_cache=False):
+    """
+    Corrige una unidad con hasta tres intentos, devolviendo la original si todos fallan.
+    
+    Entre intentos se espera con backoff exponencial y jitter (espera_reintento), igual
+    que en el corrector por segmentos, para no insistir mientras dura el error.
+    
+    Args:
+        cliente: Cliente de Anthropic
+        unidad (str): Unidad de texto a corregir
+        modelo (str): Modelo Claude a utilizar
+        id_unidad (int): Número de la unidad (para los mensajes de progreso)
+        total_unidades (int): Número total de unidades
+        limitador (LimitadorTasa): Limitador de peticiones y tokens por minuto (opcional)
+        usar_cache (bool): Reutilizar la corrección de una ejecución anterior y guardar la nueva
+        
+    Returns:
+        str: Unidad corregida (o la original si no se pudo corregir)
+    """
+    print(f"Corrigiendo unidad {id_unidad}/{total_unidades}...")
+    
+    # Hacemos tres intentos máximo por unidad
+    intentos = 0
+    unidad_corregida = None
+    
+    while intentos < 3 and unidad_corregida is None:
+        try:
+            unidad_corregida = corregir_unidad(cliente, unidad, modelo, limitador, usar_cache)
+        except Exception as e:
+            print(f"Error en intento {intentos+1}: {e}")
+            if intentos < 2:  # No esperamos tras el último intento
+                time.sleep(espera_reintento(intentos))
+            intentos += 1
+    
+    # Si todos los intentos fallaron, usamos la unidad original
+    if unidad_corregida is None:
+        unidad_corregida = unidad
+        print(f"No se pudo corregir la unidad {id_unidad}. Usando original.")
+    
+    # Verificamos si se hicieron cambios
+    if unidad_corregida != unidad:
+        print(f"  Se realizaron correcciones en la unidad {id_unidad}")
+    
+    return unidad_corregida
+
+def corregir_transcripcion_por_unidades(cliente, texto_completo, limites_segmentos=None, modelo="claude-3-7-sonnet-20250219", max_concurrencia=8, rpm=40, tpm=16000, agrupar_caracteres=0, usar_cache=True, diccionario=None, max_unidad=400):
     """
     Corrige una transcripción completa por unidades pequeñas, preservando los límites de segmentos.
     
+    Las unidades son independientes entre sí, así que se envían a Claude en paralelo
+    (como máximo `max_concurrencia` peticiones en curso) y se combinan en su orden original.
+    Un limitador compartido mantiene el ritmo por debajo de `rpm` peticiones y `tpm` tokens
+    por minuto, para no desperdiciar tiempo en errores 429 y reintentos.
+    
+    Con `agrupar_caracteres` > 0 las unidades consecutivas se agrupan en una misma petición
+    hasta ese número de caracteres; las unidades que falten en la respuesta (o todo el
+    grupo, si la respuesta no es un JSON válido) se corrigen con peticiones individuales.
+    
+    Con `usar_cache=True` las unidades corregidas en ejecuciones anteriores (mismo texto,
+    modelo y versión del prompt) se reutilizan sin llamar a la API.
+    
+    Con un `diccionario`, las unidades cuyas palabras son todas conocidas (ver
+    es_unidad_limpia) se conservan tal cual, sin enviarlas a Claude.
+    
     Args:
         cliente: Cliente de Anthropic
         texto_completo (str): Texto completo de la transcripción
         limites_segmentos (list): Lista de posiciones (en caracteres) donde hay límites de segmentos
         modelo (str): Modelo Claude a utilizar
+        max_concurrencia (int): Número máximo de unidades corregidas en paralelo
+        rpm (int): Peticiones por minuto permitidas (0 = sin límite)
+        tpm (int): Tokens de entrada por minuto permitidos (0 = sin límite)
+        agrupar_caracteres (int): Máximo de caracteres por petición agrupada (0 = sin agrupar)
+        usar_cache (bool): Reutilizar y guardar correcciones de unidades en la caché en disco
+        diccionario (frozenset): Palabras conocidas en minúsculas (opcional)
+        max_unidad (int): Máximo número de caracteres por unidad
         
     Returns:
         str: Transcripción corregida completa
     """
     # Dividir en unidades pequeñas
-    unidades = dividir_en_unidades_pequenas(texto_completo)
-    
-    # Corregir cada unidad
-    unidades_corregidas = []
-    for i, unidad in enumerate(unidades):
-        print(f"Corrigiendo unidad {i+1}/{len(unidades)}...")
-        
-        # Hacemos tres intentos máximo por unidad
-        intentos = 0
-        unidad_corregida = None
+    unidades = dividir_en_unidades_pequenas(texto_completo, max_unidad)
+    
+    # Corregir cada unidad en paralelo
+    # (el cliente de Anthropic es seguro para usarse desde varios hilos)
+    total = len(unidades)
+    limitador = LimitadorTasa(rpm, tpm) if rpm or tpm else None
+    unidades_corregidas = [None] * total
+    if diccionario is not None:
+        for i, unidad in enumerate(unidades):
+            if es_unidad_limpia(unidad, diccionario):
+                unidades_corregidas[i] = unidad
+        print(f"{total - unidades_corregidas.count(None)} unidades sin palabras desconocidas no se enviarán a Claude")
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrencia)) as executor:
+        if agrupar_caracteres > 0:
+            # Las unidades muy cortas no se envían (corregir_unidad las devuelve sin cambios),
+            # y las que ya están en la caché se toman directamente de ella: leemos el archivo
+            # una sola vez en lugar de comprobar si existe y volver a abrirlo al corregirla
+            indices = []
+            for i, unidad in enumerate(unidades):
+                if unidades_corregidas[i] is not None or not unidad or len(unidad) < 10:
+                    continue
+                unidad_en_cache = leer_cache(ruta_cache_unidad(unidad, modelo)) if usar_cache else None
+                if unidad_en_cache is not None:
+                    unidades_corregidas[i] = unidad_en_cache
+                else:
+                    indices.append(i)
+            max_unidades_por_grupo = max(1, limite_tokens_salida(modelo) // MAX_TOKENS_UNIDAD)
+            grupos = agrupar_indices(unidades, indices, agrupar_caracteres, max_unidades_por_grupo)
+            print(f"Enviando {len(indices)} unidades en {len(grupos)} peticiones agrupadas...")
+            for resultados_grupo in executor.map(
+                lambda grupo: corregir_grupo_unidades(cliente, unidades, grupo, modelo, limitador, usar_cache), grupos
+            ):
+                for i, unidad_corregida in resultados_grupo.items():
+                    unidades_corregidas[i] = unidad_corregida
         
-        while intentos < 3 and unidad_corregida is None:
-            try:
-                unidad_corregida = corregir_unidad(cliente, unidad, modelo)
-            except Exception as e:
-                print(f"Error en intento {intentos+1}: {e}")
-                time.sleep(2)  # Pequeña pausa antes de reintentar
-                intentos += 1
-        
-        # Si todos los intentos fallaron, usamos la unidad original
-        if unidad_corregida is None:
-            unidad_corregida = unidad
-            print(f"No se pudo corregir la unidad {i+1}. Usando original.")
-        
-        # Verificamos si se hicieron cambios
-        if unidad_corregida != unidad:
-            print(f"  Se realizaron correcciones en la unidad {i+1}")
-        
-        unidades_corregidas.append(unidad_corregida)
+        # Las unidades sin corrección agrupada se corrigen una a una
+        futuros = {
+            i: executor.submit(corregir_unidad_con_reintentos, cliente, unidad, modelo, i+1, total, limitador, usar_cache)
+            for i, unidad in enumerate(unidades) if unidades_corregidas[i] is None
+        }
+        for i, futuro in futuros.items():
+            unidades_corregidas[i] = futuro.result()
     
     # Combinamos todas las unidades preservando el formato original
-    texto_corregido = ""
-    es_primera_unidad = True
-    
-    for unidad in unidades_corregidas:
-        # Para el encabezado (primera unidad) no añadimos espacio
-        if es_primera_unidad:
-            texto_corregido += unidad
-            es_primera_unidad = False
-        else:
-            # Para las demás unidades, verificamos si debemos añadir espacio o no
-            if texto_corregido.endswith("\n") or unidad.startswith("\n"):
-                texto_corregido += unidad
-            else:
-                texto_corregido += " " + unidad
+    # (acumulamos las partes en una lista y recordamos si el texto combinado hasta
+    # ahora termina en salto de línea, en lugar de concatenar cadenas)
+    partes = []
+    termina_en_salto = False
+    
+    for i, unidad in enumerate(unidades_corregidas):
+        # Para el encabezado (primera unidad) no añadimos espacio; para las demás,
+        # verificamos si debemos añadir espacio o no
+        espacio = i > 0 and not (termina_en_salto or unidad.startswith("\n"))
+        if espacio:
+            partes.append(" ")
+        partes.append(unidad)
+        
+        if unidad:
+            termina_en_salto = unidad.endswith("\n")
+        elif espacio:
+            termina_en_salto = False
     
-    return texto_corregido
+    return "".join(partes)
 
 def guardar_transcripcion_corregida(transcripcion_corregida, ruta_salida):
     """Guarda la transcripción corregida en un archivo."""
     try:
         # Crear directorio si no existe
         directorio = os.path.dirname(ruta_salida)
-        if directorio and not os.path.exists(directorio):
-            os.makedirs(directorio)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
             
         with open(ruta_salida, 'w', encoding='utf-8') as archivo:
             archivo.write(transcripcion_corregida)
@@ -282,7 +653,7 @@ def guardar_transcripcion_corregida(transcripcion_corregida, ruta_salida):
         print(f"Error al guardar la transcripción corregida: {e}")
         return False
 
-def corregir_transcripcion_completa(cliente_anthropic, ruta_texto, ruta_json=None, ruta_salida=None, modelo="claude-3-7-sonnet-20250219"):
+def corregir_transcripcion_completa(cliente_anthropic, ruta_texto, ruta_json=None, ruta_salida=None, modelo="claude-3-7-sonnet-20250219", max_concurrencia=8, rpm=40, tpm=16000, agrupar_caracteres=0, usar_cache=True, ruta_diccionario=None, max_unidad=400, datos_json=None):
     """
     Función principal que coordina el proceso completo de corrección.
     
@@ -292,6 +663,15 @@ def corregir_transcripcion_completa(cliente_anthropic, ruta_texto, ruta_json=Non
         ruta_json (str): Ruta al archivo JSON con metadatos (opcional)
         ruta_salida (str): Ruta donde guardar el resultado (opcional)
         modelo (str): Modelo Claude a utilizar
+        max_concurrencia (int): Número máximo de unidades corregidas en paralelo
+        rpm (int): Peticiones por minuto permitidas (0 = sin límite)
+        tpm (int): Tokens de entrada por minuto permitidos (0 = sin límite)
+        agrupar_caracteres (int): Máximo de caracteres por petición agrupada (0 = sin agrupar)
+        usar_cache (bool): Reutilizar y guardar correcciones de unidades en la caché en disco
+        ruta_diccionario (str): Lista de palabras expandida (ver cargar_diccionario) para no enviar unidades sin errores probables (opcional)
+        max_unidad (int): Máximo número de caracteres por unidad
+        datos_json (dict): Datos de la transcripción ya cargados en memoria; si se
+            proporcionan, no se lee ruta_json (opcional)
         
     Returns:
         tuple: (bool, str) - (Éxito, Texto corregido)
@@ -308,17 +688,20 @@ def corregir_transcripcion_completa(cliente_anthropic, ruta_texto, ruta_json=Non
         nombre_base = os.path.splitext(base_name)[0]
         ruta_salida = os.path.join(directorio, f"{nombre_base}_linea_por_linea.txt")
     
-    # Leer información de segmentos si se proporciona un archivo JSON
-    limites_segmentos = None
-    if ruta_json:
+    # Leer información de segmentos si se proporciona un archivo JSON (y no la tenemos ya en memoria)
+    if ruta_json and datos_json is None:
         datos_json = leer_json_transcripcion(ruta_json)
-        if datos_json:
-            limites_segmentos = extraer_limites_segmentos(datos_json)
+    limites_segmentos = None
+    if datos_json:
+        limites_segmentos = extraer_limites_segmentos(datos_json)
+    
+    # Cargar el diccionario para filtrar unidades sin palabras desconocidas
+    diccionario = cargar_diccionario(ruta_diccionario) if ruta_diccionario else None
     
     # Corregir la transcripción por unidades pequeñas
     print(f"Iniciando corrección de la transcripción...")
     texto_corregido = corregir_transcripcion_por_unidades(
-        cliente_anthropic, texto_original, limites_segmentos, modelo
+        cliente_anthropic, texto_original, limites_segmentos, modelo, max_concurrencia, rpm, tpm, agrupar_caracteres, usar_cache, diccionario, max_unidad
     )
     
     # Guardar resultado
@@ -343,6 +726,13 @@ def main():
     parser.add_argument('--output', type=str, help='Ruta para guardar la transcripción corregida')
     parser.add_argument('--api_key', type=str, help='Clave API de Anthropic (o usar variable ANTHROPIC_API_KEY)')
     parser.add_argument('--model', type=str, default="claude-3-7-sonnet-20250219", help='Modelo Claude a utilizar')
+    parser.add_argument('--max_unidad', type=int, default=400, help='Máximo número de caracteres por unidad (unidades más grandes implican menos peticiones)')
+    parser.add_argument('--max_concurrencia', type=int, default=8, help='Número máximo de unidades corregidas en paralelo')
+    parser.add_argument('--rpm', type=int, default=40, help='Peticiones por minuto permitidas (0 = sin límite)')
+    parser.add_argument('--tpm', type=int, default=16000, help='Tokens de entrada por minuto permitidos (0 = sin límite)')
+    parser.add_argument('--sin_cache', action='store_true', help='No reutilizar ni guardar correcciones de ejecuciones anteriores')
+    parser.add_argument('--diccionario', type=str, help='Lista de palabras en español con todas sus formas, una por línea (p. ej. la salida de unmunch es_ES.dic es_ES.aff), para no enviar unidades sin palabras desconocidas')
+    parser.add_argument('--agrupar_caracteres', type=int, default=0, help='Agrupar varias unidades en una misma petición hasta este número de caracteres (0 = una petición por unidad)')
     
     args = parser.parse_args()
     
@@ -353,11 +743,13 @@ def main():
         return
     
     # Inicializar cliente
-    cliente = Anthropic(api_key=api_key)
+    cliente = obtener_cliente(api_key)
     
     # Procesar la transcripción
     exito, _ = corregir_transcripcion_completa(
-        cliente, args.input, args.json, args.output, args.model
+        cliente, args.input, args.json, args.output, args.model, args.max_concurrencia, args.rpm, args.tpm, args.agrupar_caracteres,
+        usar_cache=not args.sin_cache, ruta_diccionario=args.diccionario,
+        max_unidad=args.max_unidad
     )
     
     if exito:
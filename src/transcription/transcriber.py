@@ -12,12 +12,23 @@ Caracteristicas principales:
 """
 
 import os
+import wave
+import hashlib
+import tempfile
 import ffmpeg
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from openai import OpenAI
 from datetime import datetime
-import pandas as pd
 import json
 
+# Modelo de Whisper utilizado (forma parte de la clave de la caché)
+WHISPER_MODEL = "whisper-1"
+
+# Directorio donde se guardan las transcripciones de Whisper ya realizadas, indexadas por el
+# contenido del audio, para no volver a pagar la API al reprocesar el mismo sermón
+CACHE_DIR = Path.home() / ".cache" / "sermon-gen" / "transcriptions"
+
 class SermonTranscriber:
 
     """
@@ -33,9 +44,10 @@ class SermonTranscriber:
         input_dir (str): Directorio donde se encuentran los videos a procesar
         output_dir (str): Directorio donde se guardarán las transcripciones
         api_key (str): Clave de API de OpenAI para acceder a Whisper
+        use_cache (bool): Reutilizar las transcripciones de audios ya transcritos
     """
 
-    def __init__(self, input_dir, output_dir, api_key):
+    def __init__(self, input_dir, output_dir, api_key, use_cache=True):
         """
         Inicializa el transcriptor con las configuraciones necesarias.
 
@@ -43,10 +55,12 @@ class SermonTranscriber:
             input_dir (str): Ruta al directorio de videos de entrada
             output_dir (str): Ruta al directorio donde se guardarán las transcripciones
             api_key (str): Clave de API de OpenAI
+            use_cache (bool): Reutilizar y guardar las transcripciones en la caché en disco
         """
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.client = OpenAI(api_key=api_key)
+        self.use_cache = use_cache
 
         # Crear directorio de salida si no existe
         os.makedirs(output_dir, exist_ok=True)
@@ -68,18 +82,9 @@ class SermonTranscriber:
         Raises:
             FFmpegError: Si hay un problema durante la extracción del audio
         """
-        # Construimos el nombre del archivo de audio basado en el video original
-        video_filename = os.path.basename(video_path)
-        audio_filename = os.path.splitext(video_filename)[0] + "_audio.wav"
-        audio_path = os.path.join(self.output_dir, audio_filename)
-        
         try:
             # Configuramos el proceso de FFmpeg para extraer audio
-            stream = ffmpeg.input(video_path)
-            stream = ffmpeg.output(stream, audio_path,
-                                 acodec='pcm_s16le',  # Codec de audio sin pérdida
-                                 ac=1,                 # Mono (1 canal)
-                                 ar='16k')            # Frecuencia de muestreo de 16kHz
+            stream, audio_path = self.wav_output(ffmpeg.input(video_path), video_path)
             
             # Ejecutamos el proceso de FFmpeg
             ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
@@ -90,6 +95,139 @@ class SermonTranscriber:
             error_message = f"Error al extraer audio de {video_path}: {str(e)}"
             raise Exception(error_message)
 
+    def wav_output(self, stream, video_path):
+        """
+        Construye la salida de FFmpeg que guarda el audio de un video como WAV.
+
+        La comparten extract_audio y extract_and_split_audio, para que ambos caminos
+        generen el mismo archivo (nombre, codec, canales y frecuencia de muestreo).
+
+        Args:
+            stream: Flujo de FFmpeg del video (o de su pista de audio)
+            video_path (str): Ruta al archivo de video (da nombre al WAV)
+
+        Returns:
+            tuple: (salida de FFmpeg, ruta al archivo de audio que escribirá FFmpeg)
+        """
+        # Construimos el nombre del archivo de audio basado en el video original
+        video_filename = os.path.basename(video_path)
+        audio_filename = os.path.splitext(video_filename)[0] + "_audio.wav"
+        audio_path = os.path.join(self.output_dir, audio_filename)
+
+        output = stream.output(audio_path,
+                               acodec='pcm_s16le',  # Codec de audio sin pérdida
+                               ac=1,                 # Mono (1 canal)
+                               ar='16k')            # Frecuencia de muestreo de 16kHz
+        return output, audio_path
+
+    def get_audio_duration(self, audio_path):
+        """
+        Obtiene la duración de un archivo de audio en segundos.
+
+        Para los WAV que genera extract_audio la duración se calcula a partir de la
+        cabecera RIFF (número de muestras / frecuencia de muestreo), sin lanzar un
+        proceso de ffprobe. Para cualquier otro formato se recurre a ffprobe.
+
+        Args:
+            audio_path (str): Ruta al archivo de audio
+
+        Returns:
+            float: Duración del audio en segundos
+        """
+        try:
+            with wave.open(audio_path, 'rb') as wav_file:
+                return wav_file.getnframes() / wav_file.getframerate()
+        except (wave.Error, EOFError):
+            # No es un WAV PCM que el módulo wave sepa leer
+            probe = ffmpeg.probe(audio_path)
+            return float(probe['format']['duration'])
+
+    def segment_output(self, stream, audio_path, segment_duration):
+        """
+        Construye la salida de FFmpeg que divide un audio en segmentos mp3.
+
+        Usa el muxer "segment", que corta el audio en una sola pasada y anota en una
+        lista los archivos que va creando.
+
+        Args:
+            stream: Flujo de audio de FFmpeg a dividir
+            audio_path (str): Ruta al archivo de audio completo (da nombre a los segmentos)
+            segment_duration (int): Duración de cada segmento en segundos
+
+        Returns:
+            tuple: (salida de FFmpeg, ruta de la lista de segmentos que escribirá FFmpeg)
+        """
+        base_name = os.path.splitext(os.path.basename(audio_path))[0]
+        segment_pattern = os.path.join(self.output_dir, f"{base_name}_segment_%d.mp3")
+        segment_list_path = os.path.join(self.output_dir, f"{base_name}_segments.txt")
+
+        # Usamos el formato mp3 para reducir tamaño
+        output = stream.output(
+            segment_pattern,
+            f='segment',
+            segment_time=segment_duration,
+            segment_start_number=1,
+            segment_list=segment_list_path,
+            segment_list_type='flat',
+            reset_timestamps=1,
+            acodec='libmp3lame',
+            ac=1,
+            ar='16k',
+            ab='32k'
+        )
+        return output, segment_list_path
+
+    def read_segment_list(self, segment_list_path):
+        """
+        Lee la lista de segmentos escrita por FFmpeg y la elimina.
+
+        Returns:
+            list: Rutas a los segmentos de audio creados, en orden
+        """
+        with open(segment_list_path, 'r', encoding='utf-8') as f:
+            segments = [
+                os.path.join(self.output_dir, os.path.basename(line.strip()))
+                for line in f if line.strip()
+            ]
+        os.remove(segment_list_path)
+
+        for i, output_segment in enumerate(segments):
+            print(f"Creado segmento {i+1}/{len(segments)}: {output_segment}")
+
+        return segments
+
+    def extract_and_split_audio(self, video_path, segment_duration=300):
+        """
+        Extrae el audio de un video y lo divide en segmentos en una única ejecución de FFmpeg.
+
+        Equivale a llamar a extract_audio y después a split_audio, pero el video se
+        decodifica una sola vez: la misma pista de audio se escribe a la vez en el WAV
+        completo y en los segmentos mp3, sin volver a leer el WAV.
+
+        Args:
+            video_path (str): Ruta completa al archivo de video
+            segment_duration (int): Duración de cada segmento en segundos (default: 5 minutos)
+
+        Returns:
+            tuple: (ruta al archivo de audio extraído, lista de rutas a los segmentos)
+        """
+        try:
+            audio = ffmpeg.input(video_path).audio
+            wav, audio_path = self.wav_output(audio, video_path)
+            segment_stream, segment_list_path = self.segment_output(audio, audio_path, segment_duration)
+
+            ffmpeg.merge_outputs(wav, segment_stream).run(
+                overwrite_output=True, capture_stdout=True, capture_stderr=True
+            )
+
+            print(f"Duración total del audio: {self.get_audio_duration(audio_path)} segundos")
+            return audio_path, self.read_segment_list(segment_list_path)
+
+        except Exception as e:
+            error_message = f"Error al extraer y dividir el audio de {video_path}: {str(e)}"
+            print(error_message)
+            raise Exception(error_message)
+
     def split_audio(self, audio_path, segment_duration=300):
         """
         Divide un archivo de audio en segmentos más pequeños.
@@ -102,50 +240,19 @@ class SermonTranscriber:
             list: Lista de rutas a los segmentos de audio generados
         """
         try:
-            # Obtenemos la duración del audio usando ffprobe
-            probe = ffmpeg.probe(audio_path)
-            duration = float(probe['format']['duration'])
+            duration = self.get_audio_duration(audio_path)
             print(f"Duración total del audio: {duration} segundos")
 
-            # Calculamos cuántos segmentos necesitamos
-            num_segments = int(duration / segment_duration) + 1
-            print(f"Dividiendo en {num_segments} segmentos de {segment_duration} segundos")
-
-            # Creamos cada segmento
-            segments = []
-            for i in range(num_segments):
-                start_time = i * segment_duration
-                # Si es el último segmento, ajustamos la duración
-                if i == num_segments - 1:
-                    # No especificamos duración para el último segmento
-                    output_segment = os.path.join(
-                        self.output_dir,
-                        f"{os.path.splitext(os.path.basename(audio_path))[0]}_segment_{i+1}.mp3"
-                    )
-                    # Usamos el formato mp3 para reducir tamaño
-                    ffmpeg.input(audio_path, ss=start_time).output(
-                        output_segment,
-                        acodec='libmp3lame',
-                        ac=1,
-                        ar='16k',
-                        ab='32k'
-                    ).run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
-                else:
-                    output_segment = os.path.join(
-                        self.output_dir,
-                        f"{os.path.splitext(os.path.basename(audio_path))[0]}_segment_{i+1}.mp3"
-                    )
-                    ffmpeg.input(audio_path, ss=start_time, t=segment_duration).output(
-                        output_segment,
-                        acodec='libmp3lame',
-                        ac=1,
-                        ar='16k',
-                        ab='32k'
-                    ).run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
-
-                segments.append(output_segment)
-                print(f"Creado segmento {i+1}/{num_segments}: {output_segment}")
+            # Dividimos todo el audio en una sola pasada de FFmpeg con el muxer "segment":
+            # el WAV se lee y se codifica una única vez, en lugar de lanzar un proceso
+            # (con su búsqueda y decodificación) por cada segmento
+            print(f"Dividiendo en segmentos de {segment_duration} segundos")
+            segment_stream, segment_list_path = self.segment_output(
+                ffmpeg.input(audio_path), audio_path, segment_duration
+            )
+            segment_stream.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
 
+            segments = self.read_segment_list(segment_list_path)
             return segments
 
         except Exception as e:
@@ -153,6 +260,39 @@ class SermonTranscriber:
             print(error_message)
             raise Exception(error_message)
 
+    def cache_path(self, audio_bytes):
+        """Devuelve la ruta en caché de la transcripción de un audio, según su contenido."""
+        # blake2b es más rápido que sha256 para hashear los megas de audio de cada segmento
+        digest = hashlib.blake2b(f"{WHISPER_MODEL}|es|".encode('utf-8'), digest_size=16)
+        digest.update(audio_bytes)
+        return CACHE_DIR / f"{digest.hexdigest()}.json"
+
+    def read_cached_transcription(self, path):
+        """Lee una transcripción guardada en la caché, o devuelve None si no existe."""
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"No se pudo leer la caché de transcripciones: {str(e)}")
+            return None
+
+    def save_cached_transcription(self, path, text, segments):
+        """
+        Guarda el texto y los segmentos de una transcripción en la caché.
+
+        Escribimos en un archivo temporal y lo renombramos, para que una ejecución
+        interrumpida nunca deje en la caché una transcripción a medio escribir.
+        """
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            descriptor, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump({'text': text, 'segments': segments}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"No se pudo guardar la transcripción en caché: {str(e)}")
+
     def transcribe_audio(self, audio_path):
         """
         Transcribe un archivo de audio usando el modelo Whisper de OpenAI.
@@ -160,7 +300,8 @@ class SermonTranscriber:
         Este método maneja el proceso de transcripción, enviando el audio
         a la API de OpenAI y procesando la respuesta. La transcripción
         incluye el texto y marcas de tiempo, lo que nos permitirá
-        segmentar el contenido posteriormente.
+        segmentar el contenido posteriormente. Si el mismo audio ya se
+        transcribió antes, se reutiliza la transcripción de la caché.
         
         Args:
             audio_path (str): Ruta al archivo de audio a transcribir
@@ -169,42 +310,56 @@ class SermonTranscriber:
             dict: Diccionario con la transcripción y metadatos asociados
         """
         try:
-            # Abrimos el archivo de audio en modo binario
+            # Leemos el audio una vez: lo usamos tanto para la clave de la caché como para el envío
             with open(audio_path, 'rb') as audio_file:
+                audio_bytes = audio_file.read()
+            
+            path = self.cache_path(audio_bytes) if self.use_cache else None
+            cached = self.read_cached_transcription(path) if path else None
+            
+            if cached is not None:
+                print(f"Transcripción de {audio_path} recuperada de la caché.")
+                text = cached['text']
+                segments_list = cached['segments']
+            else:
                 # Realizamos la transcripción usando la API de OpenAI
                 response = self.client.audio.transcriptions.create(
-                    model="whisper-1",    # Modelo más reciente de Whisper
-                    file=audio_file,      # Nuestro archivo de audio
+                    model=WHISPER_MODEL,  # Modelo más reciente de Whisper
+                    file=(os.path.basename(audio_path), audio_bytes),  # Nuestro archivo de audio
                     language="es",        # Especificamos español
                     response_format="verbose_json"  # Incluye metadatos detallados
                 )
-            
-            # Debug - imprimimos información sobre la respuesta
-            print(f"Tipo de segments: {type(response.segments)}")
-            if hasattr(response, 'segments') and len(response.segments) > 0:
-                print(f"Cantidad de segmentos: {len(response.segments)}")
                 
-            # Procesamos la respuesta para extraer información útil
-            # Convertimos los objetos TranscriptionSegment a diccionarios
-            segments_list = []
-            if hasattr(response, 'segments'):
-                for seg in response.segments:
-                    segment_dict = {
-                        'start': float(seg.start),
-                        'end': float(seg.end),
-                        'text': seg.text
-                    }
-                    segments_list.append(segment_dict)
+                # Debug - imprimimos información sobre la respuesta
+                print(f"Tipo de segments: {type(response.segments)}")
+                if hasattr(response, 'segments') and len(response.segments) > 0:
+                    print(f"Cantidad de segmentos: {len(response.segments)}")
+                    
+                # Procesamos la respuesta para extraer información útil
+                # Convertimos los objetos TranscriptionSegment a diccionarios
+                segments_list = []
+                if hasattr(response, 'segments'):
+                    for seg in response.segments:
+                        segment_dict = {
+                            'start': float(seg.start),
+                            'end': float(seg.end),
+                            'text': seg.text
+                        }
+                        segments_list.append(segment_dict)
+                text = response.text
+                
+                if path:
+                    self.save_cached_transcription(path, text, segments_list)
             
             transcription_data = {
-                'text': response.text,  # Texto completo de la transcripción
+                'text': text,  # Texto completo de la transcripción
                 'segments': segments_list,  # Lista de diccionarios con segmentos
                 'timestamp': datetime.now().isoformat(),  # Cuándo se realizó
                 'audio_file': audio_path  # Referencia al archivo original
             }
             
             # Agregamos texto a la transcripción
-            all_text = response.text.strip()
+            all_text = text.strip()
             print(f"Transcripción: \"{all_text[:100]}...\"")
             
             return transcription_data
@@ -213,7 +368,7 @@ class SermonTranscriber:
             error_message = f"Error durante la transcripción de {audio_path}: {str(e)}"
             raise Exception(error_message)
 
-    def process_video(self, video_filename):
+    def process_video(self, video_filename, max_workers=4):
         """
         Procesa un video completo, desde la extracción de audio hasta la transcripción.
         
@@ -222,6 +377,7 @@ class SermonTranscriber:
         
         Args:
             video_filename (str): Nombre del archivo de video a procesar
+            max_workers (int): Número de segmentos que se transcriben en paralelo
             
         Returns:
             dict: Diccionario con la transcripción y toda la información asociada
@@ -234,13 +390,10 @@ class SermonTranscriber:
             if not os.path.exists(video_path):
                 raise FileNotFoundError(f"No se encontró el archivo: {video_path}")
             
-            # Paso 1: Extraer el audio del video
-            print(f"Extrayendo audio de {video_filename}...")
-            audio_path = self.extract_audio(video_path)
-            
-            # Paso 2: Dividir el audio en segmentos manejables
-            print(f"Dividiendo el audio en segmentos...")
-            audio_segments = self.split_audio(audio_path)
+            # Pasos 1 y 2: Extraer el audio del video y dividirlo en segmentos manejables
+            # (en una sola ejecución de FFmpeg)
+            print(f"Extrayendo audio de {video_filename} y dividiéndolo en segmentos...")
+            audio_path, audio_segments = self.extract_and_split_audio(video_path)
             
             # Paso 3: Transcribir cada segmento
             print(f"Transcribiendo {len(audio_segments)} segmentos...")
@@ -252,27 +405,37 @@ class SermonTranscriber:
                 'timestamp': datetime.now().isoformat()
             }
             
-            # Procesamos cada segmento
-            for i, segment_path in enumerate(audio_segments):
+            def transcribe_segment(indexed_segment):
+                i, segment_path = indexed_segment
                 print(f"Transcribiendo segmento {i+1}/{len(audio_segments)}...")
                 try:
-                    segment_data = self.transcribe_audio(segment_path)
-                    
-                    # Ajustamos las marcas de tiempo para los segmentos
-                    segment_offset = i * 300  # 300 segundos = 5 minutos
-                    for segment in segment_data['segments']:
-                        # Ajustamos las marcas de tiempo
-                        segment['start'] += segment_offset
-                        segment['end'] += segment_offset
-                        
-                    # Añadimos el texto a la transcripción completa
-                    all_transcription_data['text'] += ' ' + segment_data['text']
-                    # Añadimos los segmentos a la lista completa
-                    all_transcription_data['segments'].extend(segment_data['segments'])
-                    
+                    return self.transcribe_audio(segment_path)
                 except Exception as e:
                     print(f"Error transcribiendo segmento {i+1}: {str(e)}")
-                    # Continuamos con el siguiente segmento incluso si este falla
+                    # Continuamos con los demás segmentos incluso si este falla
+                    return None
+            
+            # Las llamadas a Whisper son independientes y casi todo es espera de red,
+            # así que las lanzamos en paralelo; map conserva el orden de los segmentos
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                results = list(executor.map(transcribe_segment, enumerate(audio_segments)))
+            
+            # Procesamos cada segmento en orden
+            for i, segment_data in enumerate(results):
+                if segment_data is None:
+                    continue
+                
+                # Ajustamos las marcas de tiempo para los segmentos
+                segment_offset = i * 300  # 300 segundos = 5 minutos
+                for segment in segment_data['segments']:
+                    # Ajustamos las marcas de tiempo
+                    segment['start'] += segment_offset
+                    segment['end'] += segment_offset
+                    
+                # Añadimos el texto a la transcripción completa
+                all_transcription_data['text'] += ' ' + segment_data['text']
+                # Añadimos los segmentos a la lista completa
+                all_transcription_data['segments'].extend(segment_data['segments'])
             
             # Paso 4: Guardar los resultados
             output_filename = os.path.splitext(video_filename)[0] + "_transcription.json"
@@ -286,10 +449,11 @@ class SermonTranscriber:
                 'total_segments': len(audio_segments)
             })
             
-            # Guardamos la transcripción en formato JSON
+            # Guardamos la transcripción en formato JSON compacto (sin sangría): lleva
+            # todos los segmentos de Whisper y para revisión humana ya está el .txt
             try:
                 with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(all_transcription_data, f, ensure_ascii=False, indent=4)
+                    json.dump(all_transcription_data, f, ensure_ascii=False)
                 print(f"Transcripción completada y guardada en: {output_path}")
                 
                 # Exportamos también como texto plano para revisión humana